@@ -11,6 +11,7 @@ mkdir -p ~/.config/systemd/user
 
 # Copy service file
 cp /home/lar_mo/pygroove.lar-mo.com/pygroove/deployment/pygroove.service ~/.config/systemd/user/
+cp /home/lar_mo/pygroove.lar-mo.com/pygroove/deployment/pygroove-outbox.service ~/.config/systemd/user/
 
 # Enable linger (allows user services to run without login)
 loginctl enable-linger $USER
@@ -20,10 +21,12 @@ systemctl --user daemon-reload
 
 # Enable the service
 systemctl --user enable pygroove.service
+systemctl --user enable pygroove-outbox.service
 
 echo
 echo "✓ Linger enabled for user: $USER"
 echo "✓ Service installed: pygroove.service"
+echo "✓ Service installed: pygroove-outbox.service (sends checkout emails)"
 echo "✓ Service will auto-start on reboot"
 echo
 echo "Commands:"
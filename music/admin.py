@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Genre, RecordLabel, Artist, Album, Track, Cart, CartItem, Checkout
+from .models import Genre, RecordLabel, Artist, Album, Track, Cart, CartItem, Checkout, OutboxMessage, ImportRun, ImportJournalEntry
 
 
 @admin.register(Genre)
@@ -55,7 +55,7 @@ class TrackAdmin(admin.ModelAdmin):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['id', 'cookie_id', 'created_at']
+    list_display = ['id', 'cookie_id', 'created_at', 'updated_at']
     search_fields = ['cookie_id']
     date_hierarchy = 'created_at'
 
@@ -73,3 +73,26 @@ class CheckoutAdmin(admin.ModelAdmin):
     search_fields = ['name', 'mailing_address']
     date_hierarchy = 'submitted_at'
     readonly_fields = ['submitted_at']
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    search_fields = ['subject', 'last_error']
+    list_filter = ['status']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['checkout']
+
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    list_display = ['id', 'scope', 'total', 'started_at', 'finished_at']
+    date_hierarchy = 'started_at'
+
+
+@admin.register(ImportJournalEntry)
+class ImportJournalEntryAdmin(admin.ModelAdmin):
+    list_display = ['run', 'album', 'status', 'started_at', 'finished_at']
+    search_fields = ['album__title', 'error']
+    list_filter = ['status', 'run']
+    raw_id_fields = ['album']
@@ -0,0 +1,248 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# A cache backend shared by every gunicorn worker on the box.
+#
+# Entries live in a single SQLite file opened in WAL mode, so readers never
+# block each other or the writer and the cache survives restarts. Keys are
+# versioned the usual Django way (KEY_PREFIX / VERSION / incr_version).
+# The table is bounded by MAX_ENTRIES, and optionally by MAX_BYTES of pages
+# in use: when it overflows, expired rows go first and then the least
+# recently used 1/CULL_FREQUENCY of the rest (repeatedly, for MAX_BYTES).
+#
+# get_or_set() is single-flight: when a key is missing or expired, one
+# worker takes a short lock and recomputes it while the others serve the
+# stale copy (or wait briefly if there is none).
+#
+#   CACHES = {
+#       'default': {
+#           'BACKEND': 'music.cache.SQLiteCache',
+#           'LOCATION': BASE_DIR / 'cache.sqlite3',
+#           'OPTIONS': {'MAX_ENTRIES': 5000, 'MAX_BYTES': 256 * 1024 * 1024, 'LOCK_TIMEOUT': 30},
+#       }
+#   }
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+# Reads only bump an entry's LRU timestamp when it is older than this, so
+# hot keys don't turn every cache hit into a write
+ACCESS_RESOLUTION = 30
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._lock_timeout = int(options.get('LOCK_TIMEOUT', 30))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._max_bytes = int(options.get('MAX_BYTES') or 0)
+        self._local = threading.local()
+
+    # -------------------------
+    # Connection handling
+    # -------------------------
+
+    def _connection(self):
+        """One connection per thread, reopened after gunicorn forks"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expiry(self, timeout):
+        # Django's timeout conventions: None never expires, 0 expires at once
+        return self.get_backend_timeout(timeout)
+
+    def _row(self, key):
+        return self._connection().execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+
+    def _touch_access(self, key, accessed, now):
+        if now - accessed > ACCESS_RESOLUTION:
+            self._connection().execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+
+    # -------------------------
+    # BaseCache API
+    # -------------------------
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._row(key)
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return default
+        self._touch_access(key, row[2], now)
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._store(key, value, timeout, replace=True)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._store(key, value, timeout, replace=False)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expiry(timeout), now, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across workers: the read and write happen in one write transaction"""
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            conn.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (pickle.dumps(value, self.pickle_protocol), time.time(), key),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are kept for the life of the worker thread
+        pass
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Single-flight get_or_set: only one worker recomputes a missing or
+        expired key; the rest get the stale value, or wait for the fresh
+        one up to LOCK_TIMEOUT seconds when there is nothing stale to serve.
+        """
+        full_key = self.make_and_validate_key(key, version=version)
+        row = self._row(full_key)
+        now = time.time()
+        if row is not None and (row[1] is None or row[1] > now):
+            self._touch_access(full_key, row[2], now)
+            return pickle.loads(row[0])
+
+        lock_key = f'{key}:lock'
+        deadline = now + self._lock_timeout
+        while not self.add(lock_key, os.getpid(), self._lock_timeout, version=version):
+            # Someone else is recomputing: serve stale if we have it...
+            if row is not None:
+                return pickle.loads(row[0])
+            # ...otherwise wait for their result, and give up on them at the deadline
+            if time.time() >= deadline:
+                break
+            time.sleep(0.05)
+            fresh = self._row(full_key)
+            if fresh is not None and (fresh[1] is None or fresh[1] > time.time()):
+                return pickle.loads(fresh[0])
+
+        try:
+            value = default() if callable(default) else default
+            if value is not None:
+                self.set(key, value, timeout, version=version)
+            return value
+        finally:
+            self.delete(lock_key, version=version)
+
+    # -------------------------
+    # Storage and eviction
+    # -------------------------
+
+    def _store(self, key, value, timeout, replace):
+        now = time.time()
+        blob = pickle.dumps(value, self.pickle_protocol)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not replace:
+                # An expired entry doesn't block add()
+                conn.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            cursor = conn.execute(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO cache (key, value, expires, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, blob, self._expiry(timeout), now),
+            )
+            stored = cursor.rowcount > 0
+            if stored:
+                self._cull(conn, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return stored
+
+    def _cull(self, conn, now):
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+            count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self._max_entries:
+                count -= self._evict_oldest(conn, count)
+
+        if not self._max_bytes or self._used_bytes(conn) <= self._max_bytes:
+            return
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        # Never evict the entry just stored, even if it alone is over the cap
+        while count > 1 and self._used_bytes(conn) > self._max_bytes:
+            count -= self._evict_oldest(conn, count - 1)
+
+    def _evict_oldest(self, conn, count):
+        """Delete the least recently used 1/CULL_FREQUENCY of `count` entries (at least one)"""
+        evict = max(count // self._cull_frequency, 1) if self._cull_frequency else count
+        return conn.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)', (evict,)
+        ).rowcount
+
+    def _used_bytes(self, conn):
+        # Pages holding data, from the file header: no table scan
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return (page_count - free) * conn.execute('PRAGMA page_size').fetchone()[0]
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import string
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from django.core.cache import cache
+
+# Catalog-wide cache versioning.
+#
+# Anything derived purely from the catalog (albums, artists, genres, labels)
+# is cached under the current catalog version. Changing the catalog bumps the
+# version instead of hunting down individual keys; stale entries simply stop
+# being read and age out of the cache's LRU.
+#
+# The same stamps drive conditional GET: catalog-wide pages are validated
+# against the catalog version, detail pages against their objects'
+# updated_at (see conditional_page in views).
+
+CATALOG_VERSION_KEY = 'catalog:version'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+# While an import writes to a shadow copy of the database (music/shadow.py)
+# the live catalog hasn't changed, so its cached pages must stay valid
+_bumps_suppressed = False
+
+
+@contextmanager
+def suppressed_catalog_bumps():
+    """Make bump_catalog_version() a no-op for the duration"""
+    global _bumps_suppressed
+    _bumps_suppressed = True
+    try:
+        yield
+    finally:
+        _bumps_suppressed = False
+
+
+def bump_catalog_version():
+    """Invalidate every catalog-derived cache entry. Call after bulk writes that skip signals."""
+    if _bumps_suppressed:
+        return
+    # A fresh timestamp rather than incr() so a cleared cache can't bring an old version back
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def catalog_changed_at():
+    """The catalog version as a datetime, for validating catalog-wide pages"""
+    return datetime.fromtimestamp(catalog_version() / 1e9, tz=timezone.utc)
+
+
+def version_etag(*parts):
+    """Strong ETag (unquoted) over version stamps and anything else a response depends on"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+# Only ASCII: SQLite's LIKE ignores ASCII case and nothing else, so this never changes a result
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def normalize_search(value):
+    """
+    Collapse whitespace and ASCII case so equivalent searches share a cache
+    entry. Query with the normalized value too, so one key is one result.
+    """
+    return ' '.join((value or '').split()).translate(ASCII_LOWER)
+
+
+def cached_fragment(namespace, parts, render):
+    """
+    Return render() cached under `parts` (a dict of already-normalized request
+    parameters) for the current catalog version. Concurrent misses for the
+    same key are rendered once (see SQLiteCache.get_or_set).
+    """
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    key = f'fragment:{namespace}:{catalog_version()}:{digest}'
+    return cache.get_or_set(key, render, FRAGMENT_TIMEOUT)
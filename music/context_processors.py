@@ -1,15 +1,48 @@
-from .models import Cart
+from .models import CartItem
+
+# The cart badge count rides along in a signed cookie next to cart_id, so
+# rendering a page doesn't need the database. The cookie is rewritten by every
+# cart action (see views.set_cart_count) and carries the cart id it belongs to,
+# so a count left over from an old cart is ignored. When it is missing or
+# stale the count is queried once, on the first page that shows the badge, and
+# CartCountCookieMiddleware stores the result for the following pages.
+CART_COUNT_COOKIE = 'cart_count'
+CART_COUNT_SALT = 'music.cart_count'
+CART_COUNT_MAX_AGE = 30*24*60*60
+
 
 def cart_count(request):
     """Add cart item count to all template contexts"""
     cookie_id = request.COOKIES.get('cart_id')
-    count = 0
-    
-    if cookie_id:
-        try:
-            cart = Cart.objects.get(cookie_id=cookie_id)
-            count = cart.items.count()
-        except Cart.DoesNotExist:
-            count = 0
-    
+    if not cookie_id:
+        return {'cart_item_count': 0}
+
+    signed = request.get_signed_cookie(CART_COUNT_COOKIE, default='', salt=CART_COUNT_SALT)
+    owner, _, stored_count = signed.rpartition(':')
+    if owner == cookie_id and stored_count.isdigit():
+        return {'cart_item_count': int(stored_count)}
+
+    # No (valid) cookie yet, e.g. a cart from before the cookie existed. Only
+    # counted if the template shows it (templates call callables), so JSON
+    # fragments never query or set the cookie.
+    def count():
+        if not hasattr(request, 'cart_count_cookie'):
+            request.cart_count_cookie = f'{cookie_id}:{CartItem.objects.filter(cart__cookie_id=cookie_id).count()}'
+        return int(request.cart_count_cookie.rpartition(':')[2])
+
     return {'cart_item_count': count}
+
+
+class CartCountCookieMiddleware:
+    """Save a cart count the cart_count context processor had to query"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        value = getattr(request, 'cart_count_cookie', None)
+        # Cart actions set the cookie themselves
+        if value is not None and CART_COUNT_COOKIE not in response.cookies:
+            response.set_signed_cookie(CART_COUNT_COOKIE, value, salt=CART_COUNT_SALT, max_age=CART_COUNT_MAX_AGE)
+        return response
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+# SQLite settings for the main database.
+#
+# WAL lets gunicorn's readers keep reading while an import command writes
+# (readers see the last committed state instead of waiting on the writer's
+# lock). The journal mode is stored in the database file, so migration 0016
+# switches it once. The rest only last for the connection and are set here:
+# synchronous=NORMAL is durable across application crashes in WAL mode and
+# only skips an fsync per commit, mmap/cache_size keep the hot pages in
+# memory, and busy_timeout makes a second writer wait its turn instead of
+# failing with "database is locked". Connections are kept for CONN_MAX_AGE,
+# so this runs once per worker rather than once per request. Override any of
+# them with SQLITE_PRAGMAS in secrets.json; benchmark_sqlite shows the difference.
+
+JOURNAL_MODE = 'wal'
+
+DEFAULT_PRAGMAS = {
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # KiB when negative: ~32 MB per connection
+    'temp_store': 'memory',
+    'busy_timeout': 5000,  # ms
+}
+
+
+def sqlite_pragmas():
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # On the DB-API connection, so setup isn't counted against the request
+    # that happened to open it (see music/timing.py)
+    apply_pragmas(connection.connection, sqlite_pragmas())
+
+
+connection_created.connect(configure_sqlite, dispatch_uid='music.db.configure_sqlite')
@@ -0,0 +1,197 @@
+import re
+import unicodedata
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .catalog import bump_catalog_version
+from .models import Album, Artist, Genre, RecordLabel
+from .search import index_albums, index_artists
+
+# Duplicate detection and merging for record labels, artists and genres.
+#
+# Names are normalized (accents, case, "&", punctuation, a leading "The",
+# Discogs' "(2)" disambiguators and, for labels, words like "Records") and
+# only compared when they share a normalized key or enough character
+# trigrams. Candidates come from an inverted trigram index whose postings are
+# capped (very common trigrams say nothing), so detection stays near-linear
+# instead of comparing every pair of names. Scores are trigram Jaccard
+# similarity; pairs above the threshold are joined into clusters.
+#
+# A merge plan is a list of clusters ({'keep': id, 'merge': [ids], ...}).
+# apply_merge_plan moves every album onto the kept rows with one UPDATE per
+# cluster, deletes the merged rows and refreshes the sort keys, search index
+# and catalog version, all in one transaction.
+
+MODELS = {'label': RecordLabel, 'artist': Artist, 'genre': Genre}
+ALBUM_FIELDS = {RecordLabel: 'record_label', Artist: 'artist', Genre: 'genre'}
+ALBUM_RELATIONS = {RecordLabel: 'album', Artist: 'albums', Genre: 'album'}
+# Album.<field>_sort copies of the name that a merge has to rewrite
+SORT_FIELDS = {Artist: 'artist_sort', Genre: 'genre_sort'}
+NOISE_WORDS = {
+    RecordLabel: {
+        'records', 'record', 'recordings', 'music', 'label', 'productions', 'entertainment',
+        'ltd', 'inc', 'llc', 'gmbh', 'co', 'company',
+    },
+}
+
+DISAMBIGUATOR_RE = re.compile(r'\s*\(\d+\)$')
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize_name(name, noise_words=()):
+    """Comparison key for a name: 'The Roadrunner Records (2)' -> 'roadrunner'"""
+    name = DISAMBIGUATOR_RE.sub('', name)
+    name = ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+    words = WORD_RE.findall(name.casefold().replace('&', ' and '))
+    if len(words) > 1 and words[0] == 'the':
+        words = words[1:]
+    # A name made only of noise words ("Music Records") is its own key
+    return ' '.join([word for word in words if word not in noise_words] or words)
+
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def find_clusters(model, min_score=0.75, max_postings=200):
+    """
+    Clusters of likely duplicates among `model`'s rows, best first. Each is a
+    dict with the row to keep (the one with most albums), the rows to merge
+    into it, their names and album counts, and the cluster's score (its
+    weakest link).
+    """
+    noise_words = NOISE_WORDS.get(model, ())
+    rows = list(
+        model.objects.annotate(album_count=Count(ALBUM_RELATIONS[model]))
+        .values_list('id', 'name', 'album_count').order_by('id')
+    )
+    keys = [normalize_name(name, noise_words) for _, name, _ in rows]
+    grams = [trigrams(key) for key in keys]
+
+    edges = {}
+    # Same normalized key: certain duplicates
+    by_key = defaultdict(list)
+    for i, key in enumerate(keys):
+        by_key[key].append(i)
+    for members in by_key.values():
+        for j in members[1:]:
+            edges[(members[0], j)] = 1.0
+
+    # Shared trigrams, counted through the inverted index; |A & B| is all
+    # the Jaccard score needs besides the two set sizes
+    postings = defaultdict(list)
+    for i, row_grams in enumerate(grams):
+        for gram in row_grams:
+            postings[gram].append(i)
+    for i, row_grams in enumerate(grams):
+        shared = defaultdict(int)
+        for gram in row_grams:
+            posting = postings[gram]
+            if len(posting) > max_postings:
+                continue
+            for j in posting:
+                if j > i:
+                    shared[j] += 1
+        for j, common in shared.items():
+            score = common / (len(row_grams) + len(grams[j]) - common)
+            if score >= min_score and (i, j) not in edges:
+                edges[(i, j)] = score
+
+    # Union-find over the accepted pairs
+    parent = list(range(len(rows)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in edges:
+        parent[find(i)] = find(j)
+
+    groups = defaultdict(list)
+    for i in range(len(rows)):
+        groups[find(i)].append(i)
+    cluster_scores = defaultdict(lambda: 1.0)
+    for (i, j), score in edges.items():
+        root = find(i)
+        cluster_scores[root] = min(cluster_scores[root], score)
+
+    clusters = []
+    for root, members in groups.items():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: (-rows[i][2], rows[i][0]))
+        keep, merge = members[0], members[1:]
+        clusters.append({
+            'score': round(cluster_scores[root], 3),
+            'keep': rows[keep][0],
+            'merge': [rows[i][0] for i in merge],
+            'names': {str(rows[i][0]): rows[i][1] for i in members},
+            'albums': {str(rows[i][0]): rows[i][2] for i in members},
+        })
+    clusters.sort(key=lambda cluster: (-cluster['score'], cluster['names'][str(cluster['keep'])].casefold()))
+    return clusters
+
+
+def apply_merge_plan(model, clusters):
+    """
+    Merge each cluster's 'merge' rows into its 'keep' row in one transaction;
+    returns (albums moved, rows deleted). Raises ValueError for a plan that
+    names missing rows or uses a row twice.
+    """
+    field = ALBUM_FIELDS[model]
+    plan = {}
+    for cluster in clusters:
+        keep = int(cluster['keep'])
+        for source in map(int, cluster['merge']):
+            if source == keep or source in plan or source in plan.values():
+                raise ValueError(f'{model.__name__} {source} appears more than once in the plan')
+            plan[source] = keep
+    if set(plan.values()) & set(plan):
+        raise ValueError('A kept row is also merged away elsewhere in the plan')
+
+    with transaction.atomic():
+        rows = model.objects.in_bulk(set(plan) | set(plan.values()))
+        missing = (set(plan) | set(plan.values())) - set(rows)
+        if missing:
+            raise ValueError(f'{model.__name__} ids not found: {sorted(missing)}')
+
+        sources_by_target = defaultdict(list)
+        for source, target in plan.items():
+            sources_by_target[target].append(source)
+
+        album_ids = list(Album.objects.filter(**{f'{field}__in': list(plan)}).values_list('id', flat=True))
+        now = timezone.now()
+        for target, sources in sources_by_target.items():
+            changes = {f'{field}_id': target, 'updated_at': now}
+            if model in SORT_FIELDS:
+                changes[SORT_FIELDS[model]] = rows[target].name.casefold()
+            Album.objects.filter(**{f'{field}__in': sources}).update(**changes)
+            if model is Artist:
+                _fill_blank_artist_fields(rows[target], [rows[source] for source in sources])
+
+        deleted, _ = model.objects.filter(id__in=list(plan)).delete()
+
+        index_albums(album_ids)
+        if model is Artist:
+            index_artists(list(plan))
+        transaction.on_commit(bump_catalog_version)
+    return len(album_ids), deleted
+
+
+def _fill_blank_artist_fields(target, sources):
+    """Keep a merged artist's bio, website or image when the kept artist has none"""
+    changed = False
+    for field in ('bio', 'website', 'image'):
+        if getattr(target, field):
+            continue
+        for source in sources:
+            if getattr(source, field):
+                setattr(target, field, getattr(source, field).name if field == 'image' else getattr(source, field))
+                changed = True
+                break
+    if changed:
+        target.save()
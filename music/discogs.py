@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+import discogs_client
+import requests
+from discogs_client.fetchers import UserTokenRequestsFetcher
+from requests.structures import CaseInsensitiveDict
+from django.conf import settings
+from django.core.cache import caches
+
+# Discogs API access shared by the import commands.
+#
+# Discogs allows 60 authenticated requests per minute over a moving window
+# and reports what is left in X-Discogs-Ratelimit-Remaining. Every request
+# made through make_client() draws from one RateLimiter, so any number of
+# worker threads together stay inside the budget without fixed sleeps.
+#
+# API responses (and, with --cache-images, images fetched through
+# music.downloads) are also recorded in the 'discogs' cache (see
+# ResponseCache), so reruns after a failure don't spend the budget again and
+# an import can be replayed offline from what an earlier run recorded.
+
+USER_AGENT = 'PyGroove/1.0'
+RETRY_AFTER = 10  # seconds to hold every worker back after a 429
+CACHE_MODES = ('use', 'refresh', 'replay', 'off')
+# Not-found answers are as worth remembering as hits; errors and 429s are not
+CACHEABLE_STATUS = (200, 404)
+
+
+class ReplayMiss(Exception):
+    """A replay-mode request that no earlier run recorded"""
+
+
+class CachedResponse:
+    """The parts of a requests.Response the importers use"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+class ResponseCache:
+    """
+    GET responses recorded in the 'discogs' cache, keyed by URL and query
+    (without the user token). mode is one of:
+
+      use      serve entries younger than DISCOGS_CACHE_TTL, fetch and record the rest
+      refresh  always fetch, and record the result
+      replay   serve recorded entries of any age; raise ReplayMiss instead of fetching
+      off      neither read nor record
+    """
+
+    def __init__(self, mode='use', ttl=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Unknown cache mode {mode!r}')
+        self.mode = mode
+        self.ttl = settings.DISCOGS_CACHE_TTL if ttl is None else ttl
+        self.store = caches['discogs']
+
+    def _key(self, url, params):
+        params = sorted((name, value) for name, value in (params or {}).items() if name != 'token')
+        return 'discogs:' + hashlib.sha1(f'{url}?{urlencode(params)}'.encode()).hexdigest()
+
+    def cached(self, url, params=None):
+        """
+        The recorded response for GET url?params if this mode may serve it,
+        else None. In replay mode a miss raises ReplayMiss instead.
+        """
+        if self.mode in ('off', 'refresh'):
+            return None
+        entry = self.store.get(self._key(url, params))
+        if entry is not None and (self.mode == 'replay' or time.time() - entry['fetched'] < self.ttl):
+            return CachedResponse(entry['status'], CaseInsensitiveDict(entry['headers']), entry['content'])
+        if self.mode == 'replay':
+            raise ReplayMiss(url)
+        return None
+
+    def record(self, url, response, params=None):
+        """Remember a fetched response (anything with status_code, headers and content)"""
+        if self.mode == 'off' or response.status_code not in CACHEABLE_STATUS:
+            return
+        self.store.set(self._key(url, params), {
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'content': response.content,
+            'fetched': time.time(),
+        }, None)
+
+    def fetch(self, url, send, params=None):
+        """The response for GET url?params, from the cache or by calling send()"""
+        response = self.cached(url, params)
+        if response is None:
+            response = send()
+            self.record(url, response, params)
+        return response
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. Refills at the per-minute limit Discogs reports
+    (60 until the first response says otherwise), holds at most `burst`
+    tokens, and never holds more than the server says remain, so calls made
+    by other clients on the same token are accounted for too.
+    """
+
+    def __init__(self, per_minute=60, burst=5):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, headers):
+        """Fold a response's X-Discogs-Ratelimit headers into the bucket"""
+        limit = headers.get('X-Discogs-Ratelimit')
+        remaining = headers.get('X-Discogs-Ratelimit-Remaining')
+        with self.lock:
+            if limit and limit.isdigit() and int(limit) > 0:
+                self.rate = int(limit) / 60
+            if remaining and remaining.isdigit():
+                self._refill(time.monotonic())
+                self.tokens = min(self.tokens, int(remaining))
+
+    def pause(self, seconds):
+        """Stop all requests for `seconds` (after a 429)"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class RateLimitedFetcher(UserTokenRequestsFetcher):
+    """User-token fetcher that paces requests through a shared RateLimiter and records GETs in a ResponseCache"""
+
+    # 429s are handled here, for every thread at once, instead of by per-call backoff
+    backoff_enabled = False
+
+    def __init__(self, user_token, limiter, responses, retries=3):
+        super().__init__(user_token)
+        self.limiter = limiter
+        self.responses = responses
+        self.retries = retries
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session isn't thread-safe; give each worker its own keep-alive connection
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def request(self, method, url, data, headers, params=None):
+        if method == 'GET':
+            # Cache hits don't cost a rate-limit token
+            return self.responses.fetch(url, lambda: self.send(method, url, data, headers, params), params)
+        return self.send(method, url, data, headers, params)
+
+    def send(self, method, url, data, headers, params=None):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            response = self.session.request(
+                method=method, url=url, data=data, headers=headers, params=params,
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+            self.limiter.observe(response.headers)
+            if response.status_code != 429:
+                break
+            self.limiter.pause(RETRY_AFTER)
+        return response
+
+
+def make_client(limiter=None, responses=None):
+    """
+    A discogs_client.Client whose requests all go through `limiter` and
+    `responses` (a new RateLimiter / ResponseCache if not given)
+    """
+    client = discogs_client.Client(USER_AGENT, user_token=settings.DISCOGS_TOKEN)
+    client._fetcher = RateLimitedFetcher(
+        settings.DISCOGS_TOKEN, limiter or RateLimiter(), responses or ResponseCache()
+    )
+    return client
@@ -0,0 +1,111 @@
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.files import File
+from .discogs import USER_AGENT, CachedResponse
+
+# Image downloads for the import commands.
+#
+# One ImageDownloader is shared by a whole command run. Each thread keeps its
+# own keep-alive requests.Session, bodies are streamed in chunks into a
+# spooled temporary file (memory for small images, disk beyond that) that the
+# storage backend then copies chunk by chunk, and the content type and size
+# are checked before and while the body arrives. A semaphore caps how many
+# downloads run at once however many threads ask; submit() runs them on the
+# downloader's own pool.
+#
+# Image bodies are only written to the Discogs response cache with
+# record_images (the commands' --cache-images), for runs meant to be replayed
+# offline later: that means holding each body in memory to store it, and
+# covers add up to far more than the API's JSON. Images recorded by such a
+# run are served from the cache by later ones as usual.
+
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+DEFAULT_HEADERS = {
+    # Discogs' image CDN answers 403 without a browser-like Accept
+    'User-Agent': USER_AGENT,
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+}
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ImageDownloader:
+    def __init__(self, responses=None, record_images=False, max_concurrent=4, max_bytes=10 * 1024 * 1024, timeout=10):
+        self.responses = responses
+        self.record_images = record_images
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrent)
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session isn't thread-safe; one keep-alive session per thread
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.headers.update(DEFAULT_HEADERS)
+        return self.local.session
+
+    def fetch(self, url):
+        """
+        Download an image into a django File (backed by a spooled temporary
+        file). Raises DownloadError for HTTP errors, non-image content and
+        bodies over max_bytes.
+        """
+        cached = self.responses.cached(url) if self.responses else None
+        if cached is not None:
+            self._check(url, cached.status_code, cached.headers, len(cached.content))
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+            spool.write(cached.content)
+            spool.seek(0)
+            return File(spool)
+
+        with self.slots:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                self._check(url, response.status_code, response.headers, int(response.headers.get('Content-Length') or 0))
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+                size = 0
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        spool.close()
+                        raise DownloadError(f'{url}: larger than {self.max_bytes} bytes')
+                    spool.write(chunk)
+
+        if self.responses and self.record_images:
+            spool.seek(0)
+            self.responses.record(url, CachedResponse(response.status_code, response.headers, spool.read()))
+        spool.seek(0)
+        return File(spool)
+
+    def _check(self, url, status_code, headers, size):
+        if status_code != 200:
+            raise DownloadError(f'{url}: HTTP {status_code}')
+        content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in IMAGE_TYPES:
+            raise DownloadError(f'{url}: not an image ({content_type or "no content type"})')
+        if size > self.max_bytes:
+            raise DownloadError(f'{url}: larger than {self.max_bytes} bytes')
+
+    def save(self, field_file, filename, url):
+        """Download `url` into an ImageField (saving its model); returns the stored name"""
+        image = self.fetch(url)
+        try:
+            field_file.save(filename, image, save=True)
+        finally:
+            image.close()
+        return field_file.name
+
+    def submit(self, url):
+        """fetch() on the downloader's pool; returns a Future of the File"""
+        return self.pool.submit(self.fetch, url)
+
+    def close(self):
+        self.pool.shutdown()
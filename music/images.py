@@ -0,0 +1,98 @@
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Resized JPEG/WebP copies of album covers and artist images.
+#
+# A cover stored as images/ab/cd/<sha256>.jpg gets
+# derivatives/images/ab/cd/<sha256>.320w.webp etc. next to the media library,
+# so covers shared by several albums share their derivatives too. Nothing is ever upscaled, so small originals
+# simply have fewer widths. Whatever was built is recorded on the rows using
+# the image (Album.cover_image_derivatives, Artist.image_derivatives), so the
+# {% responsive_image %} tag lists the derivatives without touching the disk.
+
+DERIVATIVE_WIDTHS = (160, 320, 640)
+
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def derivative_name(name, width, extension):
+    base, _ = os.path.splitext(name)
+    return f'derivatives/{base}.{width}w.{extension}'
+
+
+def built_widths(name, storage=default_storage):
+    """The widths whose derivatives exist in every format (checks the disk: for build time, not rendering)"""
+    return [
+        width for width in DERIVATIVE_WIDTHS
+        if all(storage.exists(derivative_name(name, width, extension)) for extension in DERIVATIVE_FORMATS)
+    ]
+
+
+def derivatives_record(name, widths=None, storage=default_storage):
+    """The value of an image's *_derivatives field once its derivatives are built"""
+    return {'name': name, 'widths': built_widths(name, storage) if widths is None else widths}
+
+
+def record_derivatives(name, widths=None, storage=default_storage):
+    """Store the built widths on the albums and artists showing this image; returns how many rows changed"""
+    from .models import Album, Artist
+    recorded = derivatives_record(name, widths, storage)
+    now = timezone.now()
+    # Stamped too: cached pages were rendered without these srcsets
+    return (
+        Album.objects.filter(cover_image=name).exclude(cover_image_derivatives=recorded)
+        .update(cover_image_derivatives=recorded, updated_at=now)
+        + Artist.objects.filter(image=name).exclude(image_derivatives=recorded)
+        .update(image_derivatives=recorded, updated_at=now)
+    )
+
+
+def derivative_urls(image, extension, storage=default_storage):
+    """[(url, width)] for the recorded derivatives of an ImageField's current file"""
+    recorded = getattr(image.instance, f'{image.field.name}_derivatives', None) or {}
+    if not image.name or recorded.get('name') != image.name:
+        return []
+    return [(storage.url(derivative_name(image.name, width, extension)), width) for width in recorded['widths']]
+
+
+def make_derivatives(name, overwrite=False, storage=default_storage):
+    """Generate the missing (or, with overwrite, all) derivatives of one image; returns how many were written"""
+    wanted = [
+        (width, extension)
+        for width in DERIVATIVE_WIDTHS
+        for extension in DERIVATIVE_FORMATS
+        if overwrite or not storage.exists(derivative_name(name, width, extension))
+    ]
+    if not wanted:
+        return 0
+
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        # Let the JPEG decoder downscale by up to 8x while decoding; much cheaper than a full decode
+        image.draft('RGB', (max(DERIVATIVE_WIDTHS), max(DERIVATIVE_WIDTHS)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    written = 0
+    for width, extension in wanted:
+        if width > image.width:
+            continue
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+        buffer = BytesIO()
+        pil_format, save_options = DERIVATIVE_FORMATS[extension]
+        resized.save(buffer, pil_format, **save_options)
+
+        target = derivative_name(name, width, extension)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        written += 1
+    return written
@@ -0,0 +1,145 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from music.db import JOURNAL_MODE, apply_pragmas, sqlite_pragmas
+
+# SQLite's own defaults (and Django's 5 second busy timeout)
+BASELINE_PRAGMAS = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'busy_timeout': 5000,
+}
+
+# What a collection page and an album page read
+READ_QUERIES = [
+    "SELECT id, title, artist_sort FROM music_album ORDER BY artist_sort, title_sort, id LIMIT 48",
+    "SELECT COUNT(*) FROM music_album",
+    "SELECT a.title, r.name FROM music_album a JOIN music_artist r ON r.id = a.artist_id WHERE a.id = ?",
+    "SELECT track_number, title, duration FROM music_track WHERE album_id = ? ORDER BY track_number",
+]
+
+
+def connect(path, pragmas):
+    conn = sqlite3.connect(path, timeout=pragmas.get('busy_timeout', 5000) / 1000, isolation_level=None)
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+def read_worker(path, pragmas, album_ids, seconds):
+    """A web worker: page reads in autocommit, as fast as it can; returns (latencies, errors)"""
+    conn = connect(path, pragmas)
+    deadline = time.monotonic() + seconds
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        album_id = random.choice(album_ids)
+        started = time.perf_counter()
+        try:
+            for query in READ_QUERIES:
+                conn.execute(query, (album_id,) if '?' in query else ()).fetchall()
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def write_worker(path, pragmas, album_ids, seconds, batch_size):
+    """An import: batches of row updates, each in its own transaction; returns how many committed"""
+    conn = connect(path, pragmas)
+    deadline = time.monotonic() + seconds
+    count = 0
+    while time.monotonic() < deadline:
+        batch = random.sample(album_ids, min(batch_size, len(album_ids)))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE music_album SET updated_at = ?, description = description WHERE id = ?",
+                [(time.time(), album_id) for album_id in batch],
+            )
+            conn.execute("COMMIT")
+            count += 1
+        except sqlite3.OperationalError:
+            conn.execute("ROLLBACK")
+    conn.close()
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Measure read throughput on copies of the database while an import-like writer runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds',
+            type=float,
+            default=5,
+            help='How long to run each configuration (default: 5)'
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Concurrent reader processes, like gunicorn workers (default: 4)'
+        )
+        parser.add_argument(
+            '--write-batch',
+            type=int,
+            default=200,
+            help='Albums the writer updates per transaction (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        # Next to the real database, so commits pay the same fsyncs
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(connection.settings_dict['NAME'])) as directory:
+            results = []
+            for label, pragmas in (('default', BASELINE_PRAGMAS), ('tuned', {'journal_mode': JOURNAL_MODE, **sqlite_pragmas()})):
+                path = os.path.join(directory, f'{label}.sqlite3')
+                self.copy_database(path, pragmas)
+                self.stdout.write(f"Running {label} for {options['seconds']:g}s...")
+                results.append((label, self.run(path, pragmas, options)))
+
+        self.stdout.write(f"\n{'':10s} {'reads/s':>9s} {'p99 ms':>8s} {'max ms':>8s} {'errors':>7s} {'writes/s':>9s}")
+        for label, (reads, p99, worst, errors, writes) in results:
+            self.stdout.write(f"{label:10s} {reads:9.0f} {p99:8.1f} {worst:8.1f} {errors:7d} {writes:9.1f}")
+        baseline, tuned = results[0][1][0], results[1][1][0]
+        if baseline:
+            self.stdout.write(self.style.SUCCESS(f"\n✓ Tuned reads: {tuned / baseline:.1f}x the default"))
+
+    def copy_database(self, path, pragmas):
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        # journal_mode is stored in the file, so set it on the copy itself
+        target.execute(f"PRAGMA journal_mode = {pragmas['journal_mode']}")
+        target.close()
+        # Don't hand the worker processes a copy of our connection
+        connections.close_all()
+
+    def run(self, path, pragmas, options):
+        conn = connect(path, pragmas)
+        album_ids = [row[0] for row in conn.execute("SELECT id FROM music_album")]
+        conn.close()
+
+        # Separate processes, like gunicorn workers and a management command
+        seconds = options['seconds']
+        with ProcessPoolExecutor(max_workers=options['readers'] + 1) as pool:
+            writer = pool.submit(write_worker, path, pragmas, album_ids, seconds, options['write_batch'])
+            readers = [pool.submit(read_worker, path, pragmas, album_ids, seconds) for _ in range(options['readers'])]
+            latencies = []
+            errors = 0
+            for reader in readers:
+                reader_latencies, reader_errors = reader.result()
+                latencies.extend(reader_latencies)
+                errors += reader_errors
+            writes = writer.result()
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        worst = latencies[-1] * 1000 if latencies else 0
+        return len(latencies) / seconds, p99, worst, errors, writes / seconds
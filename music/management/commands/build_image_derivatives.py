@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from music.catalog import bump_catalog_version
+from music.images import built_widths, make_derivatives, record_derivatives
+from music.models import Album, Artist
+
+
+def build(name, overwrite):
+    """Worker: returns (name, derivatives written, widths built, error)"""
+    try:
+        return name, make_derivatives(name, overwrite=overwrite), built_widths(name), None
+    except Exception as e:
+        return name, 0, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generate resized JPEG/WebP derivatives of album covers and artist images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: one per CPU)'
+        )
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Regenerate derivatives that already exist'
+        )
+
+    def handle(self, *args, **options):
+        names = set(Album.objects.exclude(cover_image='').exclude(cover_image=None).values_list('cover_image', flat=True))
+        names |= set(Artist.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+        total = len(names)
+        self.stdout.write(f"Generating derivatives for {total} images with {options['workers']} workers...")
+
+        # Workers only touch files; don't hand them a copy of our DB connection
+        connections.close_all()
+
+        written_count = 0
+        fail_count = 0
+        built = {}
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = [pool.submit(build, name, options['overwrite']) for name in sorted(names)]
+            for i, future in enumerate(as_completed(futures), 1):
+                name, written, widths, error = future.result()
+                if error:
+                    fail_count += 1
+                    self.stdout.write(self.style.WARNING(f"[{i}/{total}] {name}: {error}"))
+                    continue
+                built[name] = widths
+                if written:
+                    written_count += written
+                    self.stdout.write(f"[{i}/{total}] {name}: {written} derivatives")
+
+        # Rendering lists the recorded widths without checking the disk, so
+        # record them (this also picks up derivatives built by other means)
+        with transaction.atomic():
+            recorded = sum(record_derivatives(name, widths) for name, widths in built.items())
+        if recorded:
+            # Cached card fragments were rendered without these srcsets
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Wrote {written_count} derivatives"))
+        if fail_count:
+            self.stdout.write(self.style.WARNING(f"✗ Failed: {fail_count}"))
@@ -1,6 +1,22 @@
-import re
+from concurrent.futures import ProcessPoolExecutor
+import django
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from music.catalog import bump_catalog_version
 from music.models import Artist
+from music.rendering import clean_discogs_markup, render_markdown
+
+
+def clean_bios(rows):
+    """Worker: [(id, name, bio)] -> [(id, name, original bio, cleaned bio, bio_html)] for the bios that change"""
+    changed = []
+    for artist_id, name, bio in rows:
+        cleaned = clean_discogs_markup(bio)
+        if cleaned != bio:
+            changed.append((artist_id, name, bio, cleaned, render_markdown(cleaned)))
+    return changed
+
 
 class Command(BaseCommand):
     help = 'Clean up Discogs formatting in artist bios'
@@ -11,84 +27,79 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be changed without making changes'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Artists cleaned and updated per query (default: 500)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes for cleaning and rendering bios (default: 1, in this process)'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
-        artists_with_bios = Artist.objects.exclude(bio='')
+        batch_size = options['batch_size']
+
+        artists_with_bios = Artist.objects.exclude(bio='').order_by('id').values_list('id', 'name', 'bio')
         total = artists_with_bios.count()
-        
+
         if dry_run:
             self.stdout.write(self.style.WARNING(f"DRY RUN MODE - No changes will be made"))
-        
+
         self.stdout.write(f"Processing {total} artists with bios...")
-        
+
+        if options['workers'] > 1:
+            rows = list(artists_with_bios)
+            chunks = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+            # Workers only clean text; don't hand them a copy of our DB connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+                updated_count = self.apply(pool.map(clean_bios, chunks), dry_run)
+        else:
+            updated_count = self.apply(map(clean_bios, self.chunked(artists_with_bios, batch_size)), dry_run)
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"\nDRY RUN: Would update {updated_count} artists"))
+        else:
+            if updated_count:
+                bump_catalog_version()
+            self.stdout.write(self.style.SUCCESS(f"\n✓ Updated {updated_count} artists"))
+
+    def chunked(self, rows, size):
+        chunk = []
+        for row in rows.iterator(chunk_size=size):
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def apply(self, results, dry_run):
+        """Write each chunk's changed bios with one bulk_update; returns how many changed"""
         updated_count = 0
-        
-        for i, artist in enumerate(artists_with_bios, 1):
-            original_bio = artist.bio
-            cleaned_bio = self.clean_discogs_markup(original_bio)
-            
-            if cleaned_bio != original_bio:
-                self.stdout.write(f"[{i}/{total}] {artist.name}")
-                
-                if not dry_run:
-                    artist.bio = cleaned_bio
-                    artist.save()
-                    updated_count += 1
-                else:
+        for changed in results:
+            updated_count += len(changed)
+            if dry_run:
+                for _, name, original_bio, cleaned_bio, _ in changed:
+                    self.stdout.write(f"{name}")
                     self.stdout.write(f"  Would clean markup")
                     # Show sample of changes
                     if '[a=' in original_bio or '[url=' in original_bio:
                         self.stdout.write(f"    Before (sample): {original_bio[:100]}...")
                         self.stdout.write(f"    After (sample): {cleaned_bio[:100]}...")
-        
-        if dry_run:
-            self.stdout.write(self.style.SUCCESS(f"\nDRY RUN: Would update {updated_count} artists"))
-        else:
-            self.stdout.write(self.style.SUCCESS(f"\n✓ Updated {updated_count} artists"))
+                continue
 
-    def clean_discogs_markup(self, text):
-        """
-        Clean up Discogs markup from bio text:
-        - Remove [a=Artist Name] tags (keep just the artist name)
-        - Remove [url=...]text[/url] tags (keep just the text)
-        - Remove [aXXXXX] numeric artist IDs
-        - Normalize line endings and paragraph breaks
-        """
-        if not text:
-            return text
-        
-        # Normalize line endings (convert \r\n to \n)
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
-        
-        # Remove [a=Artist (id)] - extract artist name without ID
-        # Example: [a=King Diamond (2)] -> King Diamond
-        text = re.sub(r'\[a=([^\]]+?)\s*\(\d+\)\]', r'\1', text)
-        
-        # Remove [a=Artist] - keep just the artist name
-        # Example: [a=Mercyful Fate] -> Mercyful Fate
-        text = re.sub(r'\[a=([^\]]+)\]', r'\1', text)
-        
-        # Remove [aXXXXX] - numeric artist IDs without names
-        # Example: [a151718] -> (removed)
-        text = re.sub(r'\[a\d+\]', '', text)
-        
-        # Remove [url=...]text[/url] - keep just the text
-        # Example: [url=https://example.com]Click Here[/url] -> Click Here
-        text = re.sub(r'\[url=[^\]]+\]([^\[]+)\[/url\]', r'\1', text)
-        
-        # Remove [l=Label] - label references
-        # Example: [l=Metalheadz] -> Metalheadz
-        text = re.sub(r'\[l=([^\]]+)\]', r'\1', text)
-        
-        # Remove [r=Release ID] - release references
-        text = re.sub(r'\[r=?\d*\]', '', text)
-        
-        # Normalize multiple spaces
-        text = re.sub(r'  +', ' ', text)
-        
-        # Preserve double newlines (paragraph breaks) but normalize to exactly 2
-        text = re.sub(r'\n\n+', '\n\n', text)
-        
-        return text.strip()
+            # bulk_update skips save(), so carry the rendered HTML and the modification stamp along
+            now = timezone.now()
+            artists = [
+                Artist(id=artist_id, bio=cleaned_bio, bio_html=bio_html, updated_at=now)
+                for artist_id, _, _, cleaned_bio, bio_html in changed
+            ]
+            Artist.objects.bulk_update(artists, ['bio', 'bio_html', 'updated_at'])
+            self.stdout.write(f"  Cleaned {updated_count} bios")
+        return updated_count
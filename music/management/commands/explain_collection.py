@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from music.models import Album
+from music.pagination import keyset_page
+from music.views import get_album_queryset, get_artist_queryset
+
+SORTS = ['-id', 'artist', 'title', '-release_date', 'release_date', 'genre']
+
+
+class Command(BaseCommand):
+    help = 'Show EXPLAIN QUERY PLAN for the collection page queries and flag any that are not index-driven'
+
+    def handle(self, *args, **options):
+        problems = 0
+
+        for sort in SORTS:
+            queryset = get_album_queryset(QueryDict(f'sort={sort}'))
+            problems += self.explain_pages(f'Collection sort={sort}', queryset, 20)
+
+        problems += self.explain_pages('Artists', get_artist_queryset(QueryDict()), 24)
+
+        album = Album.objects.order_by('id').first()
+        if album:
+            with CaptureQueriesContext(connection) as queries:
+                list(album.tracks.all())
+            problems += self.explain('Album tracklist', queries[-1]['sql'])
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f'\n✗ {problems} queries are not fully index-driven'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✓ All collection queries are index-driven'))
+
+    def explain_pages(self, label, queryset, per_page):
+        """Explain the first page and a cursor page, exactly as the views run them"""
+        with CaptureQueriesContext(connection) as queries:
+            items, next_cursor = keyset_page(queryset, per_page=per_page)
+        problems = self.explain(f'{label} (first page)', queries[-1]['sql'])
+
+        if next_cursor:
+            with CaptureQueriesContext(connection) as queries:
+                keyset_page(queryset, next_cursor, per_page)
+            problems += self.explain(f'{label} (next page)', queries[0]['sql'])
+        return problems
+
+    def explain(self, label, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            steps = [row[-1] for row in cursor.fetchall()]
+
+        # A sort over the whole result, or a full scan of a joined table, means
+        # SQLite reads far more rows than the page it returns. A scan of the
+        # driving table in index (or rowid) order stops after LIMIT rows.
+        flagged = [step for position, step in enumerate(steps)
+                   if step.startswith('USE TEMP B-TREE')
+                   or (position > 0 and step.startswith('SCAN'))]
+        if flagged:
+            self.stdout.write(self.style.WARNING(f'✗ {label}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {label}'))
+        for step in steps:
+            self.stdout.write(f'    {step}')
+        return 1 if flagged else 0
@@ -1,11 +1,9 @@
-import discogs_client
-import requests
+from collections import deque
 from django.core.management.base import BaseCommand
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.conf import settings
+from music.discogs import CACHE_MODES, ResponseCache, make_client
+from music.downloads import ImageDownloader
 from music.models import Artist
-import time
+from music.images import make_derivatives, record_derivatives
 
 class Command(BaseCommand):
     help = 'Import artist images from Discogs API'
@@ -16,13 +14,40 @@ class Command(BaseCommand):
             action='store_true',
             help='Only import for artists without images'
         )
+        parser.add_argument(
+            '--cache',
+            choices=CACHE_MODES,
+            default='use',
+            help='Discogs response cache: use (default), refresh, replay (offline, recorded responses only) or off'
+        )
+        parser.add_argument(
+            '--cache-images',
+            action='store_true',
+            help='Also record downloaded images in the response cache, so a later --cache replay can run fully offline'
+        )
+        parser.add_argument(
+            '--downloads',
+            type=int,
+            default=4,
+            help='Image downloads to run in parallel with the searches (default: 4)'
+        )
 
     def handle(self, *args, **options):
-        # Initialize Discogs client
-        d = discogs_client.Client(
-            'PyGroove/1.0',
-            user_token=settings.DISCOGS_TOKEN
-        )
+        # Initialize Discogs client (paced by the shared rate limiter, no sleeps needed)
+        self.responses = ResponseCache(options['cache'])
+        d = make_client(responses=self.responses)
+        self.downloader = ImageDownloader(self.responses, options['cache_images'], max_concurrent=options['downloads'])
+
+        try:
+            self.import_images(d, options)
+        finally:
+            self.downloader.close()
+
+    def import_images(self, d, options):
+        # Downloads run in the background while the next artists are searched;
+        # finished ones are saved (in this thread) as the loop goes
+        self.max_pending = options['downloads'] * 2
+        pending = deque()
 
         if options['missing_only']:
             artists = Artist.objects.filter(image='')
@@ -32,8 +57,8 @@ class Command(BaseCommand):
         total = artists.count()
         self.stdout.write(f"Importing images for {total} artists...")
         
-        success_count = 0
-        fail_count = 0
+        self.success_count = 0
+        self.fail_count = 0
         
         for i, artist in enumerate(artists, 1):
             self.stdout.write(f"[{i}/{total}] {artist.name}")
@@ -44,7 +69,7 @@ class Command(BaseCommand):
                 
                 if not results:
                     self.stdout.write(self.style.WARNING(f"  No results found"))
-                    fail_count += 1
+                    self.fail_count += 1
                     continue
                 
                 # Get first result
@@ -54,35 +79,37 @@ class Command(BaseCommand):
                 if hasattr(artist_data, 'images') and artist_data.images:
                     image_url = artist_data.images[0]['uri']
                     self.stdout.write(f"  Found image: {image_url[:50]}...")
-                    
-                    # Add headers to avoid 403 Forbidden
-                    headers = {
-                        'User-Agent': 'PyGroove/1.0',
-                        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                    }
-                    response = requests.get(image_url, headers=headers, timeout=10)
-                    if response.status_code == 200:
-                        img_temp = NamedTemporaryFile(delete=True)
-                        img_temp.write(response.content)
-                        img_temp.flush()
-                        
-                        filename = f"{artist.name}.jpg".replace(' ', '_').replace('/', '_')
-                        artist.image.save(filename, File(img_temp), save=True)
-                        self.stdout.write(self.style.SUCCESS(f"  ✓ Downloaded image"))
-                        success_count += 1
-                    else:
-                        self.stdout.write(self.style.WARNING(f"  HTTP {response.status_code}"))
-                        fail_count += 1
+                    pending.append((artist, self.downloader.submit(image_url)))
                 else:
                     self.stdout.write(self.style.WARNING(f"  No images available"))
-                    fail_count += 1
-                
-                # Rate limiting
-                time.sleep(1.5)
+                    self.fail_count += 1
                 
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"  Error: {str(e)}"))
-                fail_count += 1
+                self.fail_count += 1
+
+            self.save_downloads(pending)
+
+        self.save_downloads(pending, wait=True)
         
-        self.stdout.write(self.style.SUCCESS(f"\n✓ Success: {success_count}"))
-        self.stdout.write(self.style.WARNING(f"✗ Failed: {fail_count}"))
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Success: {self.success_count}"))
+        self.stdout.write(self.style.WARNING(f"✗ Failed: {self.fail_count}"))
+
+    def save_downloads(self, pending, wait=False):
+        """Save finished downloads in order; with wait=True (or too many in flight), wait for them"""
+        while pending and (wait or pending[0][1].done() or len(pending) > self.max_pending):
+            artist, future = pending.popleft()
+            try:
+                image = future.result()
+                filename = f"{artist.name}.jpg".replace(' ', '_').replace('/', '_')
+                try:
+                    artist.image.save(filename, image, save=True)
+                finally:
+                    image.close()
+                make_derivatives(artist.image.name)
+                record_derivatives(artist.image.name)
+                self.stdout.write(self.style.SUCCESS(f"  ✓ Downloaded image for {artist.name}"))
+                self.success_count += 1
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"  ✗ {artist.name}: {str(e)}"))
+                self.fail_count += 1
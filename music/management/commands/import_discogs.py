@@ -1,11 +1,42 @@
-import discogs_client
-import requests
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
-from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.conf import settings
-from music.models import Album, Artist, Genre, RecordLabel, Track
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from music.catalog import bump_catalog_version
+from music.discogs import CACHE_MODES, ResponseCache, make_client
+from music.downloads import ImageDownloader
+from music.models import Album, Artist, Genre, RecordLabel, Track, ImportRun, ImportJournalEntry
+from music.images import derivatives_record, make_derivatives
+from music.rendering import clean_discogs_markup
+from music.search import index_albums
+
+
+class ThreadBufferedOutput:
+    """Stands in for stdout while workers run, so each album's lines come out together"""
+
+    def __init__(self, out):
+        self.out = out
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def write(self, *args, **kwargs):
+        lines = getattr(self.local, 'lines', None)
+        if lines is None:
+            self.out.write(*args, **kwargs)
+        else:
+            lines.append((args, kwargs))
+
+    def begin(self):
+        self.local.lines = []
+
+    def flush(self):
+        lines, self.local.lines = self.local.lines, None
+        with self.lock:
+            for args, kwargs in lines:
+                self.out.write(*args, **kwargs)
+
 
 class Command(BaseCommand):
     help = 'Import or update album data from Discogs API'
@@ -31,14 +62,54 @@ class Command(BaseCommand):
             action='store_true',
             help='Only update albums missing cover images or tracks'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Albums to import concurrently with --all/--missing-only (default: 1); '
+                 'all workers share one Discogs rate limit'
+        )
+        parser.add_argument(
+            '--cache',
+            choices=CACHE_MODES,
+            default='use',
+            help='Discogs response cache: use (default), refresh, replay (offline, recorded responses only) or off'
+        )
+        parser.add_argument(
+            '--cache-images',
+            action='store_true',
+            help='Also record downloaded images in the response cache, so a later --cache replay can run fully offline'
+        )
+        parser.add_argument(
+            '--downloads',
+            type=int,
+            default=4,
+            help='Most image downloads to run at once (default: 4)'
+        )
+        parser.add_argument(
+            '--resume',
+            type=int,
+            metavar='RUN_ID',
+            help='Continue an interrupted --all/--missing-only run with the albums it has not reached'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also retry the albums that failed (with --resume; on its own, for the latest run)'
+        )
 
     def handle(self, *args, **options):
-        # Initialize Discogs client
-        d = discogs_client.Client(
-            'PyGroove/1.0',
-            user_token=settings.DISCOGS_TOKEN
-        )
+        # Initialize Discogs client (paced by the shared rate limiter, no sleeps needed)
+        self.responses = ResponseCache(options['cache'])
+        d = make_client(responses=self.responses)
+        self.downloader = ImageDownloader(self.responses, options['cache_images'], max_concurrent=options['downloads'])
+
+        try:
+            self.import_albums(d, options)
+        finally:
+            self.downloader.close()
 
+    def import_albums(self, d, options):
         if options['album_id']:
             # Update single album
             try:
@@ -48,34 +119,113 @@ class Command(BaseCommand):
             except Album.DoesNotExist:
                 self.stdout.write(self.style.ERROR(f"Album with ID {options['album_id']} not found"))
         
-        elif options['all']:
-            # Update all albums
-            albums = Album.objects.all()
+        elif options['resume'] or options['retry_failed']:
+            # Pick a journaled run back up where it stopped
+            if options['resume']:
+                run = ImportRun.objects.filter(pk=options['resume']).first()
+            else:
+                run = ImportRun.objects.order_by('-id').first()
+            if not run:
+                self.stdout.write(self.style.ERROR("Import run not found"))
+                return
+
+            journaled = run.entries.all()
+            if options['retry_failed']:
+                journaled = journaled.exclude(status=ImportJournalEntry.FAILED)
+            albums = self.scope_albums(run.scope).exclude(pk__in=journaled.values('album'))
+            if options['retry_failed']:
+                # Failed albums are retried even if they have dropped out of the scope
+                failed = run.entries.filter(status=ImportJournalEntry.FAILED).values('album')
+                albums = Album.objects.filter(Q(pk__in=albums.values('pk')) | Q(pk__in=failed))
             total = albums.count()
-            self.stdout.write(f"Updating {total} albums from Discogs...")
-            
-            for i, album in enumerate(albums, 1):
-                self.stdout.write(f"[{i}/{total}] Processing: {album.artist.name} - {album.title}")
-                self.update_album_from_discogs(album, d)
-                time.sleep(1.5)  # Rate limit: ~40 requests/min (well under 60/min limit)
-        
-        elif options['missing_only']:
-            # Update albums without covers or tracks
-            from django.db.models import Q
-            albums = Album.objects.filter(Q(cover_image='') | Q(tracks__isnull=True)).distinct()
+            self.stdout.write(f"Resuming import run #{run.pk}: {total} albums left...")
+            self.update_albums(run, albums, d, total, options['workers'])
+
+        elif options['all'] or options['missing_only']:
+            scope = ImportRun.SCOPE_ALL if options['all'] else ImportRun.SCOPE_MISSING
+            albums = self.scope_albums(scope)
             total = albums.count()
-            self.stdout.write(f"Updating {total} albums missing data...")
-            
-            for i, album in enumerate(albums, 1):
-                self.stdout.write(f"[{i}/{total}] Processing: {album.artist.name} - {album.title}")
-                self.update_album_from_discogs(album, d)
-                time.sleep(1.5)  # Rate limit: ~40 requests/min (well under 60/min limit)
-        
+            run = ImportRun.objects.create(scope=scope, total=total)
+            if options['all']:
+                self.stdout.write(f"Updating {total} albums from Discogs (import run #{run.pk})...")
+            else:
+                self.stdout.write(f"Updating {total} albums missing data (import run #{run.pk})...")
+            self.update_albums(run, albums, d, total, options['workers'])
+
         else:
-            self.stdout.write(self.style.WARNING("Please specify --album-id, --all, or --missing-only"))
+            self.stdout.write(self.style.WARNING("Please specify --album-id, --all, --missing-only or --resume"))
+
+    def scope_albums(self, scope):
+        if scope == ImportRun.SCOPE_MISSING:
+            # Albums without covers or tracks
+            return Album.objects.filter(Q(cover_image='') | Q(tracks__isnull=True)).distinct()
+        return Album.objects.all()
+
+    def update_albums(self, run, albums, discogs_client, total, workers):
+        """
+        Update albums one at a time, or with `workers` threads sharing the
+        client's rate limiter, journaling each outcome against `run`
+        """
+        albums = albums.select_related('artist').order_by('id')
+
+        def process(i, album):
+            self.stdout.write(f"[{i}/{total}] Processing: {album.artist.name} - {album.title}")
+            started_at = timezone.now()
+            status, error = self.update_album_from_discogs(album, discogs_client)
+            # A single upsert statement: SQLite waits out a concurrent writer here, where a
+            # read-then-write transaction like update_or_create() would fail with "database is locked"
+            entry = ImportJournalEntry(run=run, album=album, status=status, error=error, started_at=started_at)
+            ImportJournalEntry.objects.bulk_create(
+                [entry], update_conflicts=True, unique_fields=['run', 'album'],
+                update_fields=['status', 'error', 'started_at', 'finished_at']
+            )
+
+        try:
+            if workers <= 1:
+                for i, album in enumerate(albums, 1):
+                    process(i, album)
+            else:
+                self.update_concurrently(albums, process, workers)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f"\nInterrupted. Continue with --resume {run.pk}"))
+            raise
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=['finished_at'])
+
+        counts = dict(run.entries.values_list('status').annotate(count=Count('id')))
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Done: {counts.get(ImportJournalEntry.DONE, 0)}"))
+        self.stdout.write(f"  No match: {counts.get(ImportJournalEntry.NO_MATCH, 0)}")
+        if counts.get(ImportJournalEntry.FAILED):
+            self.stdout.write(self.style.WARNING(
+                f"✗ Failed: {counts[ImportJournalEntry.FAILED]} (retry with --resume {run.pk} --retry-failed)"
+            ))
+
+    def update_concurrently(self, albums, process, workers):
+        stdout = self.stdout
+        self.stdout = ThreadBufferedOutput(stdout)
+
+        def work(i, album):
+            self.stdout.begin()
+            try:
+                process(i, album)
+            finally:
+                self.stdout.flush()
+                # Each worker thread has its own DB connection; don't leave them open
+                connection.close()
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(work, i, album) for i, album in enumerate(albums, 1)]
+            for future in as_completed(futures):
+                future.result()
+        finally:
+            # On Ctrl-C, let in-flight albums finish (and be journaled) but start no more
+            pool.shutdown(cancel_futures=True)
+            self.stdout = stdout
 
     def update_album_from_discogs(self, album, discogs_client, discogs_release_id=None):
-        """Search Discogs and update album data"""
+        """Search Discogs and update album data; returns (journal status, error text)"""
         try:
             # If specific Discogs release ID provided, use it directly
             if discogs_release_id:
@@ -98,13 +248,14 @@ class Command(BaseCommand):
                     release_results = discogs_client.search(query, type='release')
                     if not release_results:
                         self.stdout.write(self.style.WARNING(f"  No results found for: {query}"))
-                        return
+                        return ImportJournalEntry.NO_MATCH, ''
                     release = release_results[0]
                     self.stdout.write(self.style.WARNING(f"  → Using specific release (no master found)"))
             
             # Download and save cover image
+            cover_error = ''
             if release.images and not album.cover_image:
-                self.download_cover_image(album, release.images[0]['uri'])
+                cover_error = self.download_cover_image(album, release.images[0]['uri'])
             
             # Update tracklist
             if hasattr(release, 'tracklist') and release.tracklist:
@@ -126,72 +277,95 @@ class Command(BaseCommand):
                     album.release_date = f"{release.year}-01-01"
             
             album.save()
+            if cover_error:
+                # Everything else is saved; journal it as failed so --retry-failed fetches the cover again
+                self.stdout.write(self.style.WARNING(f"  ✓ Updated: {album.title} (without cover)"))
+                return ImportJournalEntry.FAILED, f"Cover image: {cover_error}"
             self.stdout.write(self.style.SUCCESS(f"  ✓ Updated: {album.title}"))
+            return ImportJournalEntry.DONE, ''
             
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"  ✗ Error updating {album.title}: {str(e)}"))
+            return ImportJournalEntry.FAILED, str(e)
 
     def download_cover_image(self, album, image_url):
-        """Download and save album cover image"""
+        """Download and save album cover image; returns the error text, or '' on success"""
         try:
-            response = requests.get(image_url)
-            if response.status_code == 200:
-                img_temp = NamedTemporaryFile(delete=True)
-                img_temp.write(response.content)
-                img_temp.flush()
-                
-                filename = f"{album.artist.name}_{album.title}.jpg".replace(' ', '_').replace('/', '_')
-                album.cover_image.save(filename, File(img_temp), save=True)
-                self.stdout.write(self.style.SUCCESS(f"    → Cover image downloaded"))
+            filename = f"{album.artist.name}_{album.title}.jpg".replace(' ', '_').replace('/', '_')
+            self.downloader.save(album.cover_image, filename, image_url)
+            make_derivatives(album.cover_image.name)
+            album.cover_image_derivatives = derivatives_record(album.cover_image.name)
+            self.stdout.write(self.style.SUCCESS(f"    → Cover image downloaded"))
+            return ''
         except Exception as e:
             self.stdout.write(self.style.WARNING(f"    → Could not download image: {str(e)}"))
+            return str(e)
+
+    def tracklist_rows(self, tracklist):
+        """[(track_number, title, duration)] for a Discogs tracklist"""
+        rows = []
+        track_counter = 1
+        for track_data in tracklist:
+            position = track_data.position
+            title = track_data.title
+            duration = track_data.duration if hasattr(track_data, 'duration') else ''
+
+            # Convert position to track number
+            # Handle formats like "1", "A1", "B2", "1-1", etc.
+            if isinstance(position, str) and position.isdigit():
+                # Simple numeric position like "1", "2"
+                track_number = int(position)
+            else:
+                # Vinyl sides ("A1", "B2"), disc-track ("1-1") or no number at all:
+                # use sequential numbering
+                track_number = track_counter
+                track_counter += 1
+
+            if track_number > 0:  # Only add tracks with valid numbers
+                rows.append((track_number, title, duration))
+        return rows
 
     def update_tracklist(self, album, tracklist):
-        """Update album tracks"""
+        """
+        Bring the album's tracks in line with a Discogs tracklist, touching
+        only the tracks that differ. The whole change (and the album's search
+        entry) commits at once, so the site never shows a half-written tracklist.
+        """
         try:
-            # Delete existing tracks
-            album.tracks.all().delete()
-            
-            # Add new tracks
-            track_counter = 1
-            for track_data in tracklist:
-                position = track_data.position
-                title = track_data.title
-                duration = track_data.duration if hasattr(track_data, 'duration') else ''
-                
-                # Convert position to track number
-                # Handle formats like "1", "A1", "B2", "1-1", etc.
-                track_number = 0
-                try:
-                    if position.isdigit():
-                        # Simple numeric position like "1", "2"
-                        track_number = int(position)
-                    else:
-                        # Extract numbers from positions like "A1", "B2", "1-1"
-                        # Just use sequential numbering for vinyl sides
-                        import re
-                        numbers = re.findall(r'\d+', position)
-                        if numbers:
-                            track_number = track_counter
-                            track_counter += 1
-                        else:
-                            # No numbers found, use sequential
-                            track_number = track_counter
-                            track_counter += 1
-                except (ValueError, AttributeError):
-                    track_number = track_counter
-                    track_counter += 1
-                
-                if track_number > 0:  # Only add tracks with valid numbers
-                    Track.objects.create(
-                        album=album,
-                        title=title,
-                        track_number=track_number,
-                        duration=duration
-                    )
-            
-            tracks_added = album.tracks.count()
-            self.stdout.write(self.style.SUCCESS(f"    → Added {tracks_added} tracks"))
+            existing = {}
+            for track in album.tracks.order_by('track_number', 'id'):
+                existing.setdefault(track.track_number, []).append(track)
+
+            to_create = []
+            to_update = []
+            for track_number, title, duration in self.tracklist_rows(tracklist):
+                matches = existing.get(track_number)
+                if not matches:
+                    to_create.append(Track(album=album, title=title, track_number=track_number, duration=duration))
+                    continue
+                track = matches.pop(0)
+                if (track.title, track.duration) != (title, duration):
+                    track.title = title
+                    track.duration = duration
+                    to_update.append(track)
+            to_delete = [track.id for tracks in existing.values() for track in tracks]
+
+            if to_create or to_update or to_delete:
+                # bulk_create/bulk_update skip the Track signals, so reindex and touch the album here
+                with transaction.atomic():
+                    if to_delete:
+                        Track.objects.filter(id__in=to_delete).delete()
+                    if to_update:
+                        Track.objects.bulk_update(to_update, ['title', 'duration'])
+                    if to_create:
+                        Track.objects.bulk_create(to_create)
+                    index_albums([album.id])
+                    Album.objects.filter(pk=album.pk).update(updated_at=timezone.now())
+                    transaction.on_commit(bump_catalog_version)
+
+            self.stdout.write(self.style.SUCCESS(
+                f"    → Tracks: {len(to_create)} added, {len(to_update)} updated, {len(to_delete)} removed"
+            ))
         except Exception as e:
             self.stdout.write(self.style.WARNING(f"    → Could not update tracks: {str(e)}"))
 
@@ -203,30 +377,37 @@ class Command(BaseCommand):
             
             # Update bio if available
             if hasattr(artist_data, 'profile') and artist_data.profile and not artist.bio:
-                artist.bio = artist_data.profile
+                artist.bio = clean_discogs_markup(artist_data.profile)
                 self.stdout.write(self.style.SUCCESS(f"    → Updated artist bio"))
             
             # Download artist image if available
             if hasattr(artist_data, 'images') and artist_data.images and not artist.image:
                 image_url = artist_data.images[0]['uri']
-                response = requests.get(image_url)
-                if response.status_code == 200:
-                    img_temp = NamedTemporaryFile(delete=True)
-                    img_temp.write(response.content)
-                    img_temp.flush()
-                    
-                    filename = f"{artist.name}.jpg".replace(' ', '_').replace('/', '_')
-                    artist.image.save(filename, File(img_temp), save=True)
-                    self.stdout.write(self.style.SUCCESS(f"    → Downloaded artist image"))
+                filename = f"{artist.name}.jpg".replace(' ', '_').replace('/', '_')
+                self.downloader.save(artist.image, filename, image_url)
+                make_derivatives(artist.image.name)
+                artist.image_derivatives = derivatives_record(artist.image.name)
+                self.stdout.write(self.style.SUCCESS(f"    → Downloaded artist image"))
             
             artist.save()
         except Exception as e:
             self.stdout.write(self.style.WARNING(f"    → Could not update artist: {str(e)}"))
 
+    def get_or_create_by_name(self, model, name):
+        """
+        get_or_create() without its read-then-write transaction, which SQLite
+        fails outright ("database is locked") while another worker is writing
+        """
+        obj = model.objects.filter(name=name).first()
+        if obj:
+            return obj, False
+        model.objects.bulk_create([model(name=name)], ignore_conflicts=True)
+        return model.objects.get(name=name), True
+
     def update_genre(self, album, genre_name):
         """Update or create genre"""
         try:
-            genre, created = Genre.objects.get_or_create(name=genre_name)
+            genre, created = self.get_or_create_by_name(Genre, genre_name)
             album.genre = genre
             if created:
                 self.stdout.write(self.style.SUCCESS(f"    → Created genre: {genre_name}"))
@@ -236,7 +417,7 @@ class Command(BaseCommand):
     def update_label(self, album, label_name):
         """Update or create record label"""
         try:
-            label, created = RecordLabel.objects.get_or_create(name=label_name)
+            label, created = self.get_or_create_by_name(RecordLabel, label_name)
             album.record_label = label
             if created:
                 self.stdout.write(self.style.SUCCESS(f"    → Created label: {label_name}"))
@@ -1,12 +1,84 @@
 import json
+import re
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils.text import slugify
+from music.catalog import bump_catalog_version
 from music.models import Genre, RecordLabel, Artist, Album
+from music.search import index_albums, index_artists
+
+
+def stream_table_rows(path, table, chunk_size=64 * 1024):
+    """
+    Yield the rows of `table` from a phpMyAdmin JSON export one at a time,
+    reading the file in chunks rather than json.load()ing all of it
+    """
+    decoder = json.JSONDecoder()
+    start = re.compile(r'"name"\s*:\s*"%s"[^{}]*?"data"\s*:\s*\[' % re.escape(table))
+    with open(path, 'r') as f:
+        buffer = ''
+        while True:
+            match = start.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # Keep enough of the tail for a table header split across reads
+            buffer = buffer[-4096:] + chunk
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                row, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The row runs past what has been read so far
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f'Unexpected end of {path} inside table {table}')
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield row
+            position = end
+
+
+def parse_release_year(release_date):
+    """The first four-digit year in a phpCDs release date (dates are inconsistent), or None"""
+    if release_date:
+        year_match = re.search(r'\d{4}', release_date)
+        if year_match:
+            return year_match.group()
+    return None
 
 
 class Command(BaseCommand):
     help = 'Import data from phpCDs JSON exports'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Stream the exports and insert in batches inside one transaction (much faster for large exports)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per bulk insert with --bulk (default: 1000)'
+        )
+
     def handle(self, *args, **options):
+        if options['bulk']:
+            self.bulk_import(options['batch_size'], options['verbosity'] > 1)
+            return
+
         self.stdout.write(self.style.SUCCESS('Starting import...'))
         
         # Import genres first
@@ -102,13 +174,7 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.WARNING(f'  Genre not found: {genre_name}'))
             
             # Parse release date (just store the year for now, as dates are inconsistent)
-            release_year = None
-            if release_date:
-                # Try to extract year from various formats
-                import re
-                year_match = re.search(r'\d{4}', release_date)
-                if year_match:
-                    release_year = year_match.group()
+            release_year = parse_release_year(release_date)
             
             # Create Album
             album, created = Album.objects.get_or_create(
@@ -127,3 +193,137 @@ class Command(BaseCommand):
                 self.stdout.write(f'  Created album: {album_title} by {artist_name}')
         
         self.stdout.write(self.style.SUCCESS(f'Imported {album_count} albums, {artist_count} artists, {label_count} labels'))
+
+    # -------------------------
+    # Bulk mode
+    # -------------------------
+
+    def bulk_import(self, batch_size, verbose):
+        """
+        The same import as the default mode, in one transaction. Names are
+        resolved through in-memory maps and new rows go in with bulk_create,
+        which skips save() and signals, so slugs, sort keys, the search index
+        and the catalog version are taken care of here.
+        """
+        self.stdout.write(self.style.SUCCESS('Starting bulk import...'))
+        self.verbose = verbose
+
+        with transaction.atomic():
+            # Everything this import creates sits above these ids
+            last_artist_id = Artist.objects.aggregate(id=Max('id'))['id'] or 0
+            last_album_id = Album.objects.aggregate(id=Max('id'))['id'] or 0
+
+            self.bulk_import_genres()
+            self.bulk_import_albums(batch_size)
+
+            index_artists(Artist.objects.filter(id__gt=last_artist_id).values_list('id', flat=True))
+            index_albums(Album.objects.filter(id__gt=last_album_id).values_list('id', flat=True))
+            transaction.on_commit(bump_catalog_version)
+
+        self.stdout.write(self.style.SUCCESS('Import completed!'))
+
+    def bulk_import_genres(self):
+        self.stdout.write('Importing genres...')
+        existing = set(Genre.objects.values_list('name', flat=True))
+
+        new_genres = []
+        for genre_item in stream_table_rows('genre_desc.json', 'genre_desc'):
+            genre_name = genre_item.get('genreName')
+            if genre_name and genre_name not in existing:
+                existing.add(genre_name)
+                new_genres.append(Genre(name=genre_name, description=genre_item.get('genreDesc') or ''))
+                if self.verbose:
+                    self.stdout.write(f'  Created genre: {genre_name}')
+
+        Genre.objects.bulk_create(new_genres)
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(new_genres)} genres'))
+
+    def bulk_import_albums(self, batch_size):
+        self.stdout.write('Importing albums...')
+        self.artists = dict(Artist.objects.values_list('name', 'id'))
+        self.labels = dict(RecordLabel.objects.values_list('name', 'id'))
+        self.genres = dict(Genre.objects.values_list('name', 'id'))
+        self.albums = set(Album.objects.values_list('title', 'artist_id'))
+        self.missing_genres = set()
+        self.counts = {'albums': 0, 'artists': 0, 'labels': 0}
+
+        batch = []
+        for cd_item in stream_table_rows('cds.json', 'cds'):
+            batch.append(cd_item)
+            if len(batch) >= batch_size:
+                self.bulk_insert_batch(batch)
+                batch = []
+        self.bulk_insert_batch(batch)
+
+        for genre_name in sorted(self.missing_genres):
+            self.stdout.write(self.style.WARNING(f'  Genre not found: {genre_name}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.counts['albums']} albums, {self.counts['artists']} artists, {self.counts['labels']} labels"
+        ))
+
+    def bulk_create_names(self, model, names, name_map, label):
+        """Create the rows named in `names` that aren't in name_map yet, and add their ids to it"""
+        new_names = [name for name in dict.fromkeys(names) if name not in name_map]
+        if not new_names:
+            return 0
+        last_id = model.objects.aggregate(id=Max('id'))['id'] or 0
+        if model is Artist:
+            objs = [Artist(name=name, slug=slugify(name)) for name in new_names]
+        else:
+            objs = [model(name=name) for name in new_names]
+        model.objects.bulk_create(objs)
+        name_map.update(model.objects.filter(id__gt=last_id).values_list('name', 'id'))
+        if self.verbose:
+            for name in new_names:
+                self.stdout.write(f'  Created {label}: {name}')
+        return len(new_names)
+
+    def bulk_insert_batch(self, batch):
+        if not batch:
+            return
+        self.counts['artists'] += self.bulk_create_names(
+            Artist, [cd_item.get('artist') for cd_item in batch], self.artists, 'artist'
+        )
+        self.counts['labels'] += self.bulk_create_names(
+            RecordLabel, [cd_item.get('record_label') for cd_item in batch if cd_item.get('record_label')],
+            self.labels, 'label'
+        )
+
+        new_albums = []
+        for cd_item in batch:
+            artist_name = cd_item.get('artist')
+            album_title = cd_item.get('album')
+            genre_name = cd_item.get('genre')
+            label_name = cd_item.get('record_label')
+            artist_id = self.artists[artist_name]
+
+            # Existing albums (or earlier rows for the same album) are left alone, as get_or_create would
+            if (album_title, artist_id) in self.albums:
+                continue
+            self.albums.add((album_title, artist_id))
+
+            genre_id = None
+            if genre_name:
+                genre_id = self.genres.get(genre_name)
+                if genre_id is None:
+                    self.missing_genres.add(genre_name)
+
+            release_year = parse_release_year(cd_item.get('release_date'))
+            new_albums.append(Album(
+                title=album_title,
+                slug=slugify(album_title),
+                artist_id=artist_id,
+                genre_id=genre_id,
+                release_date=f'{release_year}-01-01' if release_year else None,
+                number_of_discs=int(cd_item.get('number_of_discs', '1')),
+                record_label_id=self.labels.get(label_name) if label_name else None,
+                # What Album.save() would have filled in
+                title_sort=album_title.casefold(),
+                artist_sort=artist_name.casefold(),
+                genre_sort=genre_name.casefold() if genre_id else None,
+            ))
+            if self.verbose:
+                self.stdout.write(f'  Created album: {album_title} by {artist_name}')
+
+        Album.objects.bulk_create(new_albums)
+        self.counts['albums'] += len(new_albums)
@@ -1,59 +1,117 @@
-import json
 import os
+import re
+from django.conf import settings
+from django.core.files import File
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from music.catalog import bump_catalog_version
+from music.management.commands.import_phpcds import stream_table_rows
+from music.media import content_digest, content_store, release_media
 from music.models import Album
 
+COVER_RE = re.compile(r'^cover(\d+)\.jpg$')
+
 
 class Command(BaseCommand):
     help = 'Link album cover images to albums based on phpCDs ID'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Albums updated per query (default: 500)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Linking album cover images...'))
-        
-        # Load the phpCDs data to get ID mappings
-        with open('cds.json', 'r') as f:
-            data = json.load(f)
-        
-        # Find the data array
-        album_data = None
-        for item in data:
-            if item.get('type') == 'table' and item.get('name') == 'cds':
-                album_data = item.get('data', [])
-                break
-        
-        if not album_data:
-            self.stdout.write(self.style.ERROR('No album data found'))
-            return
-        
-        updated_count = 0
+
+        # One directory scan: phpCDs id -> cover file
+        cover_dir = os.path.join(settings.MEDIA_ROOT, 'album_covers')
+        with os.scandir(cover_dir) as entries:
+            covers = {
+                int(match.group(1)): entry.path
+                for entry in entries
+                if entry.is_file() and (match := COVER_RE.match(entry.name))
+            }
+
+        # One query: (artist, title) -> albums
+        albums = {}
+        for album_id, title, artist_name, cover_image in Album.objects.values_list('id', 'title', 'artist__name', 'cover_image'):
+            albums.setdefault((artist_name, title), []).append((album_id, cover_image or ''))
+
+        storage = content_store()
+        now = timezone.now()
+        changed = []
+        replaced = []
+        linked_ids = set()
+        unchanged_count = 0
         missing_count = 0
-        
-        for cd_item in album_data:
+
+        for cd_item in stream_table_rows('cds.json', 'cds'):
             phpcds_id = cd_item.get('id')
             artist_name = cd_item.get('artist')
             album_title = cd_item.get('album')
-            
-            # Find the album in our database
-            try:
-                album = Album.objects.get(title=album_title, artist__name=artist_name)
-                
-                # Check if cover image exists
-                cover_filename = f'album_covers/cover{phpcds_id}.jpg'
-                cover_path = os.path.join('media', cover_filename)
-                
-                if os.path.exists(cover_path):
-                    album.cover_image = cover_filename
-                    album.save()
-                    updated_count += 1
-                    self.stdout.write(f'  Linked cover for: {album_title}')
-                else:
-                    missing_count += 1
-                    self.stdout.write(self.style.WARNING(f'  No image file for: {album_title} (cover{phpcds_id}.jpg)'))
-                    
-            except Album.DoesNotExist:
+
+            matches = albums.get((artist_name, album_title), [])
+            if not matches:
                 self.stdout.write(self.style.WARNING(f'  Album not found: {album_title} by {artist_name}'))
-            except Album.MultipleObjectsReturned:
+                continue
+            if len(matches) > 1:
                 self.stdout.write(self.style.WARNING(f'  Multiple albums found: {album_title} by {artist_name}'))
-        
-        self.stdout.write(self.style.SUCCESS(f'Linked {updated_count} album covers'))
+                continue
+
+            path = covers.get(int(phpcds_id)) if str(phpcds_id).isdigit() else None
+            if path is None:
+                missing_count += 1
+                self.stdout.write(self.style.WARNING(f'  No image file for: {album_title} (cover{phpcds_id}.jpg)'))
+                continue
+            linked_ids.add(int(phpcds_id))
+
+            album_id, current = matches[0]
+            if current and self.linked_since_modified(storage, current, path):
+                # Already linked to this file (as far as a stat can tell); don't read and hash it again
+                unchanged_count += 1
+                continue
+            with open(path, 'rb') as f:
+                cover = File(f, os.path.basename(path))
+                name = storage.content_name(content_digest(cover), cover.name)
+                if name == current:
+                    unchanged_count += 1
+                    continue
+                # Stored once per distinct image, however many albums share it
+                storage.save(cover.name, cover)
+            if current:
+                replaced.append(current)
+            changed.append(Album(id=album_id, cover_image=name, updated_at=now))
+            self.stdout.write(f'  Linked cover for: {album_title}')
+
+        with transaction.atomic():
+            Album.objects.bulk_update(changed, ['cover_image', 'updated_at'], batch_size=options['batch_size'])
+            if changed:
+                transaction.on_commit(bump_catalog_version)
+        # bulk_update skips the signals that release replaced covers
+        for name in set(replaced):
+            release_media(name)
+
+        unlinked = sorted(os.path.basename(covers[phpcds_id]) for phpcds_id in covers.keys() - linked_ids)
+        for filename in unlinked:
+            self.stdout.write(self.style.WARNING(f'  Unlinked file: {filename}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Linked {len(changed)} album covers ({unchanged_count} already linked)'))
         self.stdout.write(self.style.WARNING(f'{missing_count} images not found'))
+        self.stdout.write(self.style.WARNING(f'{len(unlinked)} image files not linked to any album'))
+
+    def linked_since_modified(self, storage, name, path):
+        """
+        Whether the stored cover `name` has the cover file's size and was
+        stored after the file last changed. A file replaced since (even by one
+        of the same size) gets a newer mtime, and is hashed again.
+        """
+        try:
+            stored = os.stat(storage.path(name))
+            source = os.stat(path)
+        except OSError:
+            return False
+        return stored.st_size == source.st_size and source.st_mtime_ns <= stored.st_mtime_ns
@@ -0,0 +1,95 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from music.dedupe import MODELS, apply_merge_plan, find_clusters
+
+
+class Command(BaseCommand):
+    help = 'Find likely duplicate record labels, artists or genres and merge an approved plan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind',
+            choices=sorted(MODELS),
+            help='What to deduplicate'
+        )
+        parser.add_argument(
+            '--min-score',
+            type=float,
+            default=0.75,
+            help='Lowest name similarity (0-1) that proposes a merge (default: 0.75)'
+        )
+        parser.add_argument(
+            '--output',
+            metavar='PLAN',
+            help='Write the proposed clusters to this JSON file for review'
+        )
+        parser.add_argument(
+            '--apply',
+            metavar='PLAN',
+            help='Merge the clusters in this (reviewed) JSON plan in one transaction'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='With --apply, show the plan without making changes'
+        )
+
+    def handle(self, *args, **options):
+        model = MODELS[options['kind']]
+        if options['apply']:
+            self.apply_plan(model, options['apply'], options['dry_run'])
+        else:
+            self.detect(model, options['min_score'], options['output'])
+
+    def detect(self, model, min_score, output):
+        clusters = find_clusters(model, min_score=min_score)
+
+        self.stdout.write(f'\n{self.style.SUCCESS("="*70)}')
+        self.stdout.write(self.style.SUCCESS(f'Likely duplicate {model._meta.verbose_name_plural}'))
+        self.stdout.write(f'{self.style.SUCCESS("="*70)}\n')
+        for cluster in clusters:
+            self.write_cluster(cluster)
+
+        merged = sum(len(cluster['merge']) for cluster in clusters)
+        self.stdout.write(f'\n{len(clusters)} clusters, {merged} {model._meta.verbose_name_plural} to merge')
+        if output:
+            with open(output, 'w') as f:
+                json.dump({'kind': model._meta.model_name, 'clusters': clusters}, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Wrote plan to {output}; remove the clusters you reject (or change "keep"), then use --apply'
+            ))
+
+    def apply_plan(self, model, path, dry_run):
+        with open(path) as f:
+            plan = json.load(f)
+        if plan.get('kind') != model._meta.model_name:
+            raise CommandError(f'{path} is a plan for {plan.get("kind")}, not {model._meta.model_name}')
+        clusters = plan['clusters']
+
+        for cluster in clusters:
+            self.write_cluster(cluster)
+        if dry_run:
+            self.stdout.write(f'\n{self.style.WARNING("DRY RUN - No changes made")}')
+            return
+
+        self.stdout.write(f'\n{self.style.WARNING(f"Merge {len(clusters)} clusters? (yes/no)")}')
+        if input().lower() != 'yes':
+            self.stdout.write(self.style.ERROR('Cancelled'))
+            return
+
+        try:
+            moved, deleted = apply_merge_plan(model, clusters)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Moved {moved} albums, deleted {deleted} {model._meta.verbose_name_plural}'))
+
+    def write_cluster(self, cluster):
+        names = cluster.get('names', {})
+        albums = cluster.get('albums', {})
+
+        def describe(row_id):
+            return f'[{row_id}] {names.get(str(row_id), "?")} ({albums.get(str(row_id), "?")} albums)'
+
+        self.stdout.write(f'{cluster.get("score", 0):.2f}  keep  {describe(cluster["keep"])}')
+        for row_id in cluster['merge']:
+            self.stdout.write(f'      merge {describe(row_id)}')
@@ -0,0 +1,117 @@
+import os
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from music.catalog import bump_catalog_version
+from music.images import DERIVATIVE_FORMATS, DERIVATIVE_WIDTHS, derivative_name
+from music.media import content_digest, content_store, delete_media, is_content_addressed, media_references
+from music.models import Album, Artist
+
+LEGACY_DIRS = ('album_covers', 'artist_images')
+
+
+class Command(BaseCommand):
+    help = 'Move album covers and artist images into the content-addressed media store, dropping duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be moved without changing anything'
+        )
+        parser.add_argument(
+            '--delete-unreferenced',
+            action='store_true',
+            help='Also delete files under album_covers/ and artist_images/ that no album or artist uses '
+                 '(including cover files link_images has not linked yet)'
+        )
+
+    def handle(self, *args, **options):
+        self.storage = content_store()
+        dry_run = options['dry_run']
+
+        names = set(Album.objects.exclude(cover_image='').exclude(cover_image=None).values_list('cover_image', flat=True))
+        names |= set(Artist.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+        legacy = sorted(name for name in names if not is_content_addressed(name))
+        total = len(legacy)
+        self.stdout.write(f"Moving {total} images into the media store...")
+
+        # Store every legacy file first; rows are only rewritten once all of them are in place
+        moved = {}
+        stored = {}
+        missing_count = 0
+        for i, name in enumerate(legacy, 1):
+            if not self.storage.exists(name):
+                missing_count += 1
+                self.stdout.write(self.style.WARNING(f"[{i}/{total}] {name}: file missing, left as is"))
+                continue
+            with self.storage.open(name, 'rb') as f:
+                if dry_run:
+                    new_name = self.storage.content_name(content_digest(f), name)
+                else:
+                    new_name = self.storage.save(name, f)
+            moved[name] = new_name
+            stored.setdefault(new_name, []).append(name)
+            self.stdout.write(f"[{i}/{total}] {name} → {new_name}")
+
+        duplicate_count = sum(len(olds) - 1 for olds in stored.values())
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n✓ Would move {len(moved)} images into {len(stored)} stored files ({duplicate_count} duplicates)"
+            ))
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            for old, new in moved.items():
+                Album.objects.filter(cover_image=old).update(cover_image=new, updated_at=now)
+                Artist.objects.filter(image=old).update(image=new, updated_at=now)
+            transaction.on_commit(bump_catalog_version)
+
+        # The old files are now unreferenced (unless something linked them meanwhile)
+        freed = 0
+        for new, olds in stored.items():
+            for old in olds:
+                self.move_derivatives(old, new)
+                if not media_references(old):
+                    freed += self.storage.size(old)
+                    delete_media(old, self.storage)
+
+        if options['delete_unreferenced']:
+            freed += self.delete_unreferenced()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✓ Moved {len(moved)} images into {len(stored)} stored files "
+            f"({duplicate_count} duplicates, {freed / 1024 / 1024:.1f} MB freed)"
+        ))
+        if missing_count:
+            self.stdout.write(self.style.WARNING(f"✗ Missing files: {missing_count}"))
+
+    def move_derivatives(self, old, new):
+        """Derivatives depend only on the image, so rename them rather than regenerate"""
+        for width in DERIVATIVE_WIDTHS:
+            for extension in DERIVATIVE_FORMATS:
+                source = derivative_name(old, width, extension)
+                if not self.storage.exists(source):
+                    continue
+                target = derivative_name(new, width, extension)
+                if self.storage.exists(target):
+                    self.storage.delete(source)
+                else:
+                    os.makedirs(os.path.dirname(self.storage.path(target)), exist_ok=True)
+                    os.replace(self.storage.path(source), self.storage.path(target))
+
+    def delete_unreferenced(self):
+        freed = 0
+        for directory in LEGACY_DIRS:
+            if not self.storage.exists(directory):
+                continue
+            _, filenames = self.storage.listdir(directory)
+            for filename in filenames:
+                name = f'{directory}/{filename}'
+                if media_references(name):
+                    continue
+                freed += self.storage.size(name)
+                delete_media(name, self.storage)
+                self.stdout.write(f"  Deleted unreferenced {name}")
+        return freed
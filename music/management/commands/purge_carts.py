@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from music.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned carts (never checked out, cookie expired) in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Purge carts not touched for this many days (default: 30, the cart cookie lifetime)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Carts deleted per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.1,
+            help='Seconds to wait between batches so the site can get the write lock (default: 0.1)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many carts would be purged without deleting anything'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        abandoned = Cart.objects.filter(updated_at__lt=cutoff, checkout__isnull=True)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("DRY RUN MODE - No changes will be made"))
+            self.stdout.write(f"Would purge {abandoned.count()} carts not touched since {cutoff:%Y-%m-%d}")
+            return
+
+        self.stdout.write(f"Purging carts not touched since {cutoff:%Y-%m-%d}...")
+
+        cart_count = 0
+        item_count = 0
+        while True:
+            ids = list(abandoned.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+
+            # Each batch is its own short transaction so SQLite's write lock
+            # is only ever held for a moment. The filter is checked again in
+            # it: a cart checked out or reused since the ids were read stays,
+            # items and all (they go with their cart through CASCADE).
+            with transaction.atomic():
+                _, deleted = abandoned.filter(id__in=ids).delete()
+
+            item_count += deleted.get('music.CartItem', 0)
+            cart_count += deleted.get('music.Cart', 0)
+            self.stdout.write(f"  Purged {cart_count} carts...")
+            time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Purged {cart_count} carts and {item_count} cart items"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from music.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for albums and artists'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding search index...')
+        album_count, artist_count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {album_count} albums and {artist_count} artists'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from music.catalog import bump_catalog_version
+from music.models import Artist
+from music.rendering import render_markdown
+
+
+class Command(BaseCommand):
+    help = 'Re-render the stored HTML for every artist bio'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Artists updated per query (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        artists = Artist.objects.only('id', 'bio', 'bio_html').order_by('id')
+        total = artists.count()
+        self.stdout.write(f"Rendering bios for {total} artists...")
+
+        now = timezone.now()
+        changed = []
+        updated_count = 0
+        for artist in artists.iterator(chunk_size=options['batch_size']):
+            html = render_markdown(artist.bio)
+            if html != artist.bio_html:
+                # bulk_update skips save(), so bump the modification stamp here (artist page ETags)
+                artist.bio_html = html
+                artist.updated_at = now
+                changed.append(artist)
+            if len(changed) >= options['batch_size']:
+                Artist.objects.bulk_update(changed, ['bio_html', 'updated_at'])
+                updated_count += len(changed)
+                changed = []
+
+        if changed:
+            Artist.objects.bulk_update(changed, ['bio_html', 'updated_at'])
+            updated_count += len(changed)
+
+        if updated_count:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"\n✓ Updated {updated_count} artists"))
@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from music.outbox import send_due
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails (checkout notifications) from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Messages sent per SMTP connection (default: 50)'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=settings.OUTBOX_MAX_ATTEMPTS,
+            help=f'Give up on a message after this many tries (default: {settings.OUTBOX_MAX_ATTEMPTS})'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, checking for due messages every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds between checks with --loop (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        total_sent = 0
+        total_failed = 0
+        try:
+            while True:
+                sent, failed = send_due(options['batch_size'], options['max_attempts'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}")
+                if sent + failed == options['batch_size']:
+                    # A full batch; there may be more due right away
+                    continue
+                if not options['loop']:
+                    break
+                # Don't hold a connection (or a stale read snapshot) while idle
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("\nStopped"))
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Sent: {total_sent}"))
+        if total_failed:
+            self.stdout.write(self.style.WARNING(f"✗ Failed attempts: {total_failed}"))
@@ -0,0 +1,78 @@
+import argparse
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from music.catalog import bump_catalog_version
+from music.media import deferred_media_releases, release_media
+from music.shadow import LiveCatalogChanged, remove_database, snapshot, swap_catalog, use_database
+
+IMPORT_COMMANDS = ('import_discogs', 'import_phpcds', 'import_artist_images', 'cleanup_discogs_data', 'link_images')
+
+
+class Command(BaseCommand):
+    help = 'Run a catalog import against a shadow copy of the database, then swap the new catalog in at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shadow',
+            help='Path of the shadow database (default: next to the live one, as db.shadow.sqlite3)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the shadow database if the import or the swap fails'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Swap even if the live catalog changed during the import: those edits are lost. The check '
+                 'sees rows added or deleted and albums, artists, genres or labels saved through the site or '
+                 'the ORM, but not raw SQL updates of unstamped columns such as track titles'
+        )
+        parser.add_argument(
+            'import_command',
+            choices=IMPORT_COMMANDS,
+            help='The import to run'
+        )
+        parser.add_argument(
+            'import_args',
+            nargs=argparse.REMAINDER,
+            help='Arguments for the import (e.g. --all --workers 4)'
+        )
+
+    def handle(self, *args, **options):
+        live = str(connection.settings_dict['NAME'])
+        shadow = options['shadow'] or str(settings.BASE_DIR / 'db.shadow.sqlite3')
+
+        self.stdout.write(f"Copying {live} to {shadow}...")
+        taken_at, extent = snapshot(shadow)
+
+        swapped = False
+        try:
+            with deferred_media_releases() as releases:
+                self.stdout.write(self.style.SUCCESS(f"Running {options['import_command']} on the shadow copy\n"))
+                with use_database(shadow):
+                    call_command(options['import_command'], *options['import_args'], stdout=self.stdout, stderr=self.stderr)
+
+                self.stdout.write("\nSwapping the new catalog in...")
+                try:
+                    counts = swap_catalog(shadow, taken_at, extent, force=options['force'])
+                except LiveCatalogChanged as e:
+                    raise CommandError(
+                        f"The live catalog changed during the import ({e}); nothing was swapped. "
+                        f"Rerun the import, or use --force to overwrite those changes."
+                    )
+                swapped = True
+        finally:
+            if swapped or not options['keep']:
+                remove_database(shadow)
+
+        bump_catalog_version()
+        # Files the import stopped using can go now that the live catalog doesn't use them either
+        for name in set(releases):
+            release_media(name)
+
+        for table, count in counts.items():
+            self.stdout.write(f"  {table}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("\n✓ Swapped the new catalog in"))
@@ -0,0 +1,246 @@
+import hashlib
+import mimetypes
+import os
+import re
+from contextlib import contextmanager
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Production media serving (album covers, artist images, derivatives).
+#
+# Media URLs are versioned so responses can be cached by browsers forever: a
+# content-addressed name (below) is its own version, and any other file gets
+# ?v=<mtime>-<size> from VersionedMediaStorage, which costs a stat() and never
+# a read; a changed file gets a new URL. serve_media answers
+# conditional GETs with 304, supports single byte ranges, and hands the file
+# to gunicorn's sendfile path via FileResponse. With MEDIA_ACCEL set, it only
+# checks the request and lets nginx (X-Accel-Redirect) or Apache/lighttpd
+# (X-Sendfile) send the bytes, so image traffic never occupies a worker for
+# the length of a transfer.
+#
+# Album covers and artist images live in a content-addressed store: a file is
+# named by the SHA-256 of its bytes (images/ab/cd/<sha256>.jpg), so the same
+# image is stored once however many albums or artists use it, the two-level
+# sharding keeps directories small, and the name itself is the version.
+# Rows are the reference counts: a stored file is deleted once no album or
+# artist points at it any more (see release_media and the signals). Resized
+# derivatives (derivatives/images/...) are named after their original, so
+# they count as content-addressed too; they are only rebuilt with new encoder
+# settings, and a browser may keep showing the previous encoding until then.
+
+CONTENT_STORE_PREFIX = 'images/'
+DERIVATIVE_PREFIX = 'derivatives/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_version(stat):
+    """A file's version from its stat(): changes whenever it is rewritten"""
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(CONTENT_STORE_PREFIX)
+
+
+def is_immutable(name):
+    """Whether a media name changes whenever its content does: stored images and their derivatives"""
+    if name and name.startswith(DERIVATIVE_PREFIX):
+        name = name[len(DERIVATIVE_PREFIX):]
+    return is_content_addressed(name)
+
+
+class VersionedMediaStorage(FileSystemStorage):
+    """FileSystemStorage whose URLs are versioned for far-future caching"""
+
+    def url(self, name):
+        url = super().url(name)
+        if is_immutable(name):
+            return url
+        try:
+            return f'{url}?v={file_version(os.stat(self.path(name)))}'
+        except OSError:
+            return url
+
+
+class ContentAddressedStorage(VersionedMediaStorage):
+    """Stores each distinct file once, under a name derived from its SHA-256"""
+
+    def content_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '.jpeg':
+            extension = '.jpg'
+        return f'{CONTENT_STORE_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(content_digest(content), name)
+        if not self.exists(name):
+            stored = self._save(name, content)
+            if stored != name:
+                # Another process stored the same bytes first; keep theirs
+                self.delete(stored)
+        return name
+
+
+def content_digest(content):
+    """SHA-256 of a django File, read in chunks; leaves it rewound"""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_store():
+    return ContentAddressedStorage()
+
+
+def media_references(name):
+    """How many albums and artists use this stored file"""
+    from .models import Album, Artist
+    return Album.objects.filter(cover_image=name).count() + Artist.objects.filter(image=name).count()
+
+
+def delete_media(name, storage):
+    """Delete an image and its derivatives"""
+    from .images import DERIVATIVE_FORMATS, DERIVATIVE_WIDTHS, derivative_name
+    storage.delete(name)
+    for width in DERIVATIVE_WIDTHS:
+        for extension in DERIVATIVE_FORMATS:
+            storage.delete(derivative_name(name, width, extension))
+
+
+# While an import writes to a shadow database (see music.shadow), the live
+# catalog may still show files the shadow no longer references, so releases
+# are collected here and carried out after the swap
+_deferred_releases = None
+
+
+@contextmanager
+def deferred_media_releases():
+    """Collect release_media() calls instead of acting on them; yields the list of names"""
+    global _deferred_releases
+    _deferred_releases = names = []
+    try:
+        yield names
+    finally:
+        _deferred_releases = None
+
+
+def release_media(name, storage=None):
+    """Delete a content-addressed file (and its derivatives) once nothing references it"""
+    if _deferred_releases is not None:
+        _deferred_releases.append(name)
+        return False
+    if not is_content_addressed(name) or media_references(name):
+        return False
+    delete_media(name, storage or content_store())
+    return True
+
+
+class _RangeFile:
+    """Read at most `length` bytes of an open file, starting at `start`"""
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def _byte_range(header, size):
+    """(start, end) for a single satisfiable 'bytes=' range, None to ignore it, or False if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except Exception:
+        raise Http404('Invalid path')
+    if not os.path.isfile(full_path):
+        raise Http404('"%s" does not exist' % path)
+
+    stat = os.stat(full_path)
+    version = file_version(stat)
+    etag = f'"{version}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        accel = getattr(settings, 'MEDIA_ACCEL', None)
+
+        if accel == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        elif accel == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = _file_response(request, full_path, stat.st_size, etag, content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    # Only a URL that names this exact version may be cached forever
+    versioned = is_immutable(path) or request.GET.get('v') == version
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if versioned else DEFAULT_CACHE_CONTROL
+    return response
+
+
+def _file_response(request, full_path, size, etag, content_type):
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        # A plain file object lets gunicorn use sendfile()
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_RangeFile(open(full_path, 'rb'), start, length), content_type=content_type, status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
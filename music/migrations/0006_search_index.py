@@ -0,0 +1,75 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import music.models
+
+
+ALBUM_DOCUMENT = """
+    SELECT a.id, a.title, ar.name, COALESCE(l.name, ''), COALESCE(g.name, ''),
+           COALESCE((SELECT group_concat(t.title, ' ') FROM music_track t WHERE t.album_id = a.id), '')
+    FROM music_album a
+    JOIN music_artist ar ON ar.id = a.artist_id
+    LEFT JOIN music_recordlabel l ON l.id = a.record_label_id
+    LEFT JOIN music_genre g ON g.id = a.genre_id
+"""
+
+# The tables are kept in sync by model signals (music/signals.py), not
+# triggers: SQLite refuses Django's table rebuilds for AddField/AlterField
+# while a trigger mentions the table being rebuilt.
+
+CREATE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE music_album_fts USING fts5(
+        title, artist, label, genre, tracks,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    # Title and artist matches outrank label/genre/track matches
+    "INSERT INTO music_album_fts(music_album_fts, rank) VALUES ('rank', 'bm25(10.0, 8.0, 2.0, 2.0, 1.0)')",
+    """CREATE VIRTUAL TABLE music_artist_fts USING fts5(
+        name, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+
+    # Index whatever is already in the catalog
+    f"INSERT INTO music_album_fts(rowid, title, artist, label, genre, tracks) {ALBUM_DOCUMENT}",
+    "INSERT INTO music_artist_fts(rowid, name) SELECT id, name FROM music_artist",
+]
+
+DROP_SEARCH_INDEX = [
+    "DROP TABLE IF EXISTS music_album_fts",
+    "DROP TABLE IF EXISTS music_artist_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_album_slug_artist_slug'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SEARCH_INDEX, DROP_SEARCH_INDEX),
+        migrations.CreateModel(
+            name='AlbumSearchIndex',
+            fields=[
+                ('album', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='music.album')),
+                ('document', music.models.SearchDocumentField(db_column='music_album_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'music_album_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArtistSearchIndex',
+            fields=[
+                ('artist', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='music.artist')),
+                ('document', music.models.SearchDocumentField(db_column='music_artist_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'music_artist_fts',
+                'managed': False,
+            },
+        ),
+    ]
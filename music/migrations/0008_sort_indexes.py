@@ -0,0 +1,59 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:11
+
+from django.db import migrations, models
+
+
+def fill_sort_keys(apps, schema_editor):
+    Album = apps.get_model('music', 'Album')
+    albums = list(Album.objects.select_related('artist', 'genre'))
+    for album in albums:
+        album.title_sort = album.title.casefold()
+        album.artist_sort = album.artist.name.casefold()
+        album.genre_sort = album.genre.name.casefold() if album.genre_id else None
+    Album.objects.bulk_update(albums, ['title_sort', 'artist_sort', 'genre_sort'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='artist_sort',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='genre_sort',
+            field=models.CharField(blank=True, editable=False, max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='title_sort',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_sort_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist_sort', 'title_sort', 'id'], name='album_artist_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['title_sort', 'id'], name='album_title_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['release_date', 'id'], name='album_release_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['genre_sort', 'artist_sort', 'id'], name='album_genre_sort_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['album', 'track_number'], name='track_album_number_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def dedupe_carts(apps, schema_editor):
+    """
+    Collapse carts sharing a cookie_id so the column can be made unique.
+    The newest open cart (or the newest cart, if all were checked out) keeps
+    the cookie_id. Other open carts merge their items into it and are deleted.
+    Other checked-out carts are kept for history under "<cookie_id>:<id>".
+    """
+    Cart = apps.get_model('music', 'Cart')
+    CartItem = apps.get_model('music', 'CartItem')
+    Checkout = apps.get_model('music', 'Checkout')
+
+    duplicates = (Cart.objects.values('cookie_id')
+                  .annotate(carts=Count('id')).filter(carts__gt=1)
+                  .values_list('cookie_id', flat=True))
+    for cookie_id in list(duplicates):
+        carts = list(Cart.objects.filter(cookie_id=cookie_id).order_by('-id'))
+        checked_out = set(Checkout.objects.filter(cart__in=carts).values_list('cart_id', flat=True))
+        open_carts = [cart for cart in carts if cart.id not in checked_out]
+        keeper = open_carts[0] if open_carts else carts[0]
+
+        for cart in carts:
+            if cart.id == keeper.id:
+                continue
+            if cart.id in checked_out:
+                Cart.objects.filter(id=cart.id).update(cookie_id=f'{cookie_id}:{cart.id}')
+                continue
+            for item in CartItem.objects.filter(cart=cart):
+                merged = CartItem.objects.filter(cart=keeper, album_id=item.album_id).update(
+                    quantity=F('quantity') + item.quantity
+                )
+                if not merged:
+                    CartItem.objects.filter(id=item.id).update(cart=keeper)
+            Cart.objects.filter(id=cart.id).delete()
+
+
+def fill_updated_at(apps, schema_editor):
+    Cart = apps.get_model('music', 'Cart')
+    Cart.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_carts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cart',
+            name='cookie_id',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
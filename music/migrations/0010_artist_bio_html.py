@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_cart_cookie_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='bio_html',
+            field=models.TextField(blank=True, editable=False, help_text='Bio rendered to HTML (updated on save)'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0011_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'All albums'), ('missing-only', 'Albums missing covers or tracks')], max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportJournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('done', 'Done'), ('failed', 'Failed'), ('no-match', 'No match')], max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(auto_now=True)),
+                ('album', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.album')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='music.importrun')),
+            ],
+            options={
+                'verbose_name_plural': 'import journal entries',
+                'unique_together': {('run', 'album')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.26 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import music.media
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_import_journal'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='album',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=music.media.content_store, upload_to='album_covers/'),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=music.media.content_store, upload_to='artist_images/'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.26 on 2026-10-18 13:07
+
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+# Frozen copies of music.images at the time of this migration
+DERIVATIVE_WIDTHS = (160, 320, 640)
+DERIVATIVE_EXTENSIONS = ('webp', 'jpg')
+
+
+def derivatives_record(name):
+    base, _ = os.path.splitext(name)
+    widths = [
+        width for width in DERIVATIVE_WIDTHS
+        if all(default_storage.exists(f'derivatives/{base}.{width}w.{extension}') for extension in DERIVATIVE_EXTENSIONS)
+    ]
+    return {'name': name, 'widths': widths}
+
+
+def record_existing_derivatives(apps, schema_editor):
+    """Record the derivatives already on disk; rendering no longer looks for them"""
+    for model_name, field in [('Album', 'cover_image'), ('Artist', 'image')]:
+        model = apps.get_model('music', model_name)
+        names = model.objects.exclude(**{field: ''}).exclude(**{field: None}).values_list(field, flat=True)
+        for name in set(names):
+            model.objects.filter(**{field: name}).update(**{f'{field}_derivatives': derivatives_record(name)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0014_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(record_existing_derivatives, migrations.RunPython.noop),
+    ]
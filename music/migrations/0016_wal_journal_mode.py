@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# The journal mode is stored in the database file, so switching to WAL once
+# here covers every later connection (see music/db.py). It can't change
+# inside a transaction, hence atomic = False.
+
+
+def set_journal_mode(mode):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode = {mode}')
+    return run
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('music', '0015_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('wal'), set_journal_mode('delete')),
+    ]
@@ -1,9 +1,59 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
+from .media import content_store
+from .rendering import render_markdown
 
-class Genre(models.Model):
+
+class LoadedValuesMixin:
+    """
+    Remembers the values of `loaded_fields` (attnames) as they were read from
+    or last saved to the database, so save() and signals can tell what changed
+    without querying for it.
+    """
+    loaded_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded(cls.loaded_fields)
+        return instance
+
+    def _remember_loaded(self, fields):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in fields:
+            if field in self.__dict__:  # deferred fields stay unknown
+                value = self.__dict__[field]
+                loaded[field] = getattr(value, 'name', value)  # FieldFile -> its name
+
+    def loaded_value(self, field, default=None):
+        return self.__dict__.get('_loaded_values', {}).get(field, default)
+
+    def has_changed(self, field):
+        """Whether `field` differs from its stored value (True when that isn't known)"""
+        loaded = self.__dict__.get('_loaded_values', {})
+        value = getattr(self, field)
+        return field not in loaded or loaded[field] != getattr(value, 'name', value)
+
+    def save(self, *args, update_fields=None, **kwargs):
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._remember_loaded(self.loaded_fields if update_fields is None else
+                              [f for f in self.loaded_fields if f in update_fields or f.removesuffix('_id') in update_fields])
+
+
+class Genre(LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=30, unique=True)
     description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    loaded_fields = ['name']
+
+    def save(self, *args, **kwargs):
+        renamed = not self._state.adding and self.has_changed('name')
+        super(Genre, self).save(*args, **kwargs)
+        # Keep the denormalized sort key on this genre's albums in step with renames
+        if renamed:
+            self.album_set.update(genre_sort=self.name.casefold())
 
     def __str__(self):
         return self.name
@@ -11,28 +61,41 @@ class Genre(models.Model):
 
 class RecordLabel(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
-class Artist(models.Model):
+class Artist(LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(blank=True)
     bio = models.TextField(blank=True)
+    bio_html = models.TextField(blank=True, editable=False, help_text="Bio rendered to HTML (updated on save)")
     website = models.URLField(max_length=200, blank=True)
-    image = models.ImageField(upload_to='artist_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='artist_images/', storage=content_store, blank=True, null=True)
+    # {'name': image name, 'widths': [...]} of the resized copies built for it (see music/images.py)
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    loaded_fields = ['name', 'bio', 'image']
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        if self._state.adding or self.has_changed('bio'):
+            self.bio_html = render_markdown(self.bio)
+        renamed = not self._state.adding and self.has_changed('name')
         super(Artist, self).save(*args, **kwargs)
+        # Keep the denormalized sort key on this artist's albums in step with renames
+        if renamed:
+            self.albums.update(artist_sort=self.name.casefold())
 
     def __str__(self):
         return self.name
 
 
-class Album(models.Model):
+class Album(LoadedValuesMixin, models.Model):
     title = models.CharField(max_length=100)
     slug = models.SlugField(blank=True)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='albums')
@@ -40,12 +103,40 @@ class Album(models.Model):
     release_date = models.DateField(blank=True, null=True)
     number_of_discs = models.PositiveSmallIntegerField(default=1)
     record_label = models.ForeignKey(RecordLabel, on_delete=models.SET_NULL, null=True)
-    cover_image = models.ImageField(upload_to='album_covers/', blank=True, null=True)
+    cover_image = models.ImageField(upload_to='album_covers/', storage=content_store, blank=True, null=True)
+    cover_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True)
+    # Also touched when the album's tracks, artist, genre or label change (see signals)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Case-folded copies of the sort columns so every collection sort order
+    # can be read straight off an index on this table
+    title_sort = models.CharField(max_length=100, blank=True, editable=False)
+    artist_sort = models.CharField(max_length=100, blank=True, editable=False)
+    genre_sort = models.CharField(max_length=30, blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['artist_sort', 'title_sort', 'id'], name='album_artist_sort_idx'),
+            models.Index(fields=['title_sort', 'id'], name='album_title_sort_idx'),
+            models.Index(fields=['release_date', 'id'], name='album_release_date_idx'),
+            models.Index(fields=['genre_sort', 'artist_sort', 'id'], name='album_genre_sort_idx'),
+        ]
+
+    loaded_fields = ['artist_id', 'genre_id', 'cover_image']
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        self.title_sort = self.title.casefold()
+        # The stored keys follow renames (Artist.save, Genre.save), so only look
+        # up the name when the album moved or the related object is at hand anyway
+        if Album.artist.is_cached(self) or self.has_changed('artist_id'):
+            self.artist_sort = self.artist.name.casefold()
+        if not self.genre_id:
+            self.genre_sort = None
+        elif Album.genre.is_cached(self) or self.has_changed('genre_id'):
+            self.genre_sort = self.genre.name.casefold()
         super(Album, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -60,14 +151,55 @@ class Track(models.Model):
 
     class Meta:
         ordering = ['track_number']
+        indexes = [
+            models.Index(fields=['album', 'track_number'], name='track_album_number_idx'),
+        ]
 
     def __str__(self):
         return f"{self.track_number}. {self.title}"
 
 
+class SearchDocumentField(models.TextField):
+    """FTS5 hidden column named after its table; only useful with ``__match``."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class AlbumSearchIndex(models.Model):
+    """Read-only view of the music_album_fts FTS5 table (kept in sync by signals)"""
+    album = models.OneToOneField(Album, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING, related_name='search_index')
+    document = SearchDocumentField(db_column='music_album_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'music_album_fts'
+
+
+class ArtistSearchIndex(models.Model):
+    """Read-only view of the music_artist_fts FTS5 table (kept in sync by signals)"""
+    artist = models.OneToOneField(Artist, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING, related_name='search_index')
+    document = SearchDocumentField(db_column='music_artist_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'music_artist_fts'
+
+
 class Cart(models.Model):
-    cookie_id = models.CharField(max_length=50)
+    cookie_id = models.CharField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last time the cart_id cookie was (re)issued; purge_carts expires carts from this
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Cart {self.id} ({self.cookie_id})"
@@ -92,3 +224,79 @@ class Checkout(models.Model):
 
     def __str__(self):
         return f"Checkout for Cart {self.cart.id} - {self.name}"
+
+
+class OutboxMessage(models.Model):
+    """An email queued in the request's transaction and delivered by send_outbox"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    checkout = models.ForeignKey(Checkout, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    from_email = models.CharField(max_length=200)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)} ({self.status})"
+
+
+class ImportRun(models.Model):
+    """One import_discogs --all / --missing-only run, resumable from its journal"""
+    SCOPE_ALL = 'all'
+    SCOPE_MISSING = 'missing-only'
+    SCOPE_CHOICES = [
+        (SCOPE_ALL, 'All albums'),
+        (SCOPE_MISSING, 'Albums missing covers or tracks'),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    total = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import run {self.id} ({self.scope})"
+
+
+class ImportJournalEntry(models.Model):
+    """The outcome of one album in an ImportRun"""
+    DONE = 'done'
+    FAILED = 'failed'
+    NO_MATCH = 'no-match'
+    STATUS_CHOICES = [
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (NO_MATCH, 'No match'),
+    ]
+
+    run = models.ForeignKey(ImportRun, on_delete=models.CASCADE, related_name='entries')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('run', 'album')]
+        verbose_name_plural = 'import journal entries'
+
+    def __str__(self):
+        return f"Run {self.run_id}: {self.album_id} {self.status}"
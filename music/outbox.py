@@ -0,0 +1,143 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from .models import OutboxMessage
+
+# Outgoing email.
+#
+# Requests never talk to SMTP. They add OutboxMessage rows in their own
+# transaction (so a checkout and its notifications are saved or rolled back
+# together), and the send_outbox command delivers them: one SMTP connection
+# per batch, and a failed message is retried with exponential backoff until
+# OUTBOX_MAX_ATTEMPTS, after which it is marked failed and left for the admin.
+# Run a single sender; rows aren't claimed, so two would double-send.
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE = 60  # seconds before the first retry; doubles with every attempt
+RETRY_MAX = 60 * 60 * 6
+
+
+def checkout_messages(checkout, cart):
+    """The notification to The Collector and the requestor's copy, as unsaved OutboxMessages"""
+    items = cart.items.select_related('album__artist').all()
+
+    email_body = f"""PyGroove Album Request
+======================
+
+From: {checkout.name}
+Email: {checkout.email}
+
+CHECKOUT REQUEST
+================
+
+Requested Albums:
+
+"""
+    for i, item in enumerate(items, 1):
+        email_body += f"""Album #{i}:
+  ID: {item.album.id}
+  Artist: {item.album.artist.name}
+  Album: {item.album.title}
+  Year: {item.album.release_date.year if item.album.release_date else 'N/A'}
+  Quantity: {item.quantity}
+
+"""
+
+    email_body += f"""
+Shipping Address:
+-----------------
+{checkout.mailing_address}
+"""
+
+    if checkout.message:
+        email_body += f"""
+Additional Message:
+-------------------
+{checkout.message}
+"""
+
+    subject = "PyGroove :: Album Request"
+    return [
+        # To The Collector
+        OutboxMessage(
+            checkout=checkout,
+            subject=subject,
+            body=email_body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[settings.COLLECTOR_EMAIL],
+        ),
+        # Copy to requestor
+        OutboxMessage(
+            checkout=checkout,
+            subject=f"Copy: {subject}",
+            body=f"This is a copy of your album request to PyGroove:\n\n{email_body}",
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[checkout.email],
+        ),
+    ]
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX))
+
+
+def send_due(batch_size=50, max_attempts=None):
+    """
+    Send up to batch_size due messages over one SMTP connection; returns
+    (sent, failed). Failures are rescheduled, or marked failed once they
+    have used up max_attempts.
+    """
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    now = timezone.now()
+    messages = list(
+        OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+    if not messages:
+        return 0, 0
+
+    sent = []
+    failed = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # The server is down: the whole batch waits for the next attempt
+        logger.warning("Could not connect to send %d emails: %s", len(messages), e)
+        failed = [(message, e) for message in messages]
+    else:
+        try:
+            for message in messages:
+                try:
+                    EmailMessage(
+                        message.subject, message.body, message.from_email, message.to, connection=connection
+                    ).send()
+                    sent.append(message)
+                except Exception as e:
+                    logger.warning("Could not send outbox message %d: %s", message.id, e)
+                    failed.append((message, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    for message in sent:
+        message.status = OutboxMessage.STATUS_SENT
+        message.attempts += 1
+        message.sent_at = now
+        message.last_error = ''
+    for message, error in failed:
+        message.attempts += 1
+        message.last_error = str(error)
+        if message.attempts >= max_attempts:
+            message.status = OutboxMessage.STATUS_FAILED
+            logger.error("Giving up on outbox message %d after %d attempts: %s", message.id, message.attempts, error)
+        else:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+    OutboxMessage.objects.bulk_update(
+        sent + [message for message, _ in failed],
+        ['status', 'attempts', 'sent_at', 'last_error', 'next_attempt_at'],
+    )
+    return len(sent), len(failed)
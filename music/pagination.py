@@ -0,0 +1,104 @@
+from django.core import signing
+from django.db.models import F, Q
+
+# Keyset ("cursor") pagination for the infinite-scroll endpoints.
+#
+# Instead of COUNT(*) + OFFSET, each page remembers the sort key of its last
+# row and the next page asks for rows strictly after it. The cursor handed to
+# the browser is that sort key, signed so it can't be tampered with and salted
+# with the ordering so a cursor from one sort order is rejected by another.
+#
+# The queryset's order_by() must end in a unique column (normally id) so the
+# ordering is total. NULLs follow SQLite's rules: first when ascending, last
+# when descending.
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _ordering(queryset):
+    return [(field[1:], True) if field.startswith('-') else (field, False)
+            for field in queryset.query.order_by]
+
+
+def _salt(ordering):
+    return 'music.pagination:' + ','.join(('-' if desc else '') + field for field, desc in ordering)
+
+
+def encode_cursor(values, ordering):
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return signing.dumps(values, salt=_salt(ordering), compress=True)
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        values = signing.loads(cursor, salt=_salt(ordering))
+    except signing.BadSignature:
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def _after(ordering, values):
+    """
+    Q objects for the rows that sort strictly after the cursor row, as
+    (seek, tail). seek is bounded on the leading sort column so SQLite can
+    start an index range scan right at the cursor. tail, when not None,
+    matches the rows that sort after everything seek can reach (the NULLs of
+    a descending leading column, which a range bound would exclude); it is
+    only queried once seek runs dry.
+    """
+    condition = Q(pk__in=[])
+    equal = Q()
+    tail = None
+    for position, ((field, desc), value) in enumerate(zip(ordering, values)):
+        if value is None:
+            # NULLs sort first ascending and last descending
+            beyond = Q(pk__in=[]) if desc else Q(**{f'{field}__isnull': False})
+            same = Q(**{f'{field}__isnull': True})
+        else:
+            beyond = Q(**{f'{field}__lt' if desc else f'{field}__gt': value})
+            if desc and position == 0:
+                tail = Q(**{f'{field}__isnull': True})
+            elif desc:
+                beyond |= Q(**{f'{field}__isnull': True})
+            same = Q(**{field: value})
+        condition |= equal & beyond
+        equal &= same
+
+    # Give SQLite a range to seek on for the leading sort column
+    field, desc = ordering[0]
+    if values[0] is not None:
+        condition &= Q(**{f'{field}__lte' if desc else f'{field}__gte': values[0]})
+    return condition, tail
+
+
+def keyset_page(queryset, cursor=None, per_page=20):
+    """
+    Return (items, next_cursor) for the page after `cursor` (or the first
+    page when it is empty). next_cursor is None on the last page.
+    Raises InvalidCursor for cursors that weren't issued for this ordering.
+    """
+    ordering = _ordering(queryset)
+    if not ordering:
+        raise ValueError('keyset_page() needs an ordered queryset')
+
+    keys = {f'keyset_{i}': F(field) for i, (field, desc) in enumerate(ordering)}
+    queryset = queryset.annotate(**keys)
+    if not cursor:
+        # Fetch one extra row to learn whether there is a next page without a COUNT
+        rows = list(queryset[:per_page + 1])
+    else:
+        seek, tail = _after(ordering, decode_cursor(cursor, ordering))
+        rows = list(queryset.filter(seek)[:per_page + 1])
+        if tail is not None and len(rows) <= per_page:
+            rows += list(queryset.filter(tail)[:per_page + 1 - len(rows)])
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, key) for key in keys], ordering)
+    return items, next_cursor
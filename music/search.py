@@ -0,0 +1,108 @@
+import re
+from django.db import connection, transaction
+
+# Full-text search over the catalog.
+#
+# music_album_fts and music_artist_fts are SQLite FTS5 tables created in
+# migration 0006. They are kept in sync by the model signals in signals.py;
+# code that writes with bulk_create()/update() should call index_albums() /
+# index_artists() for the rows it touched, or rebuild_search_index().
+#
+# (Triggers would catch bulk writes too, but SQLite triggers that mention
+# music_album break Django's table-rebuilding migrations.)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+ALBUM_DOCUMENT = """
+    SELECT a.id, a.title, ar.name, COALESCE(l.name, ''), COALESCE(g.name, ''),
+           COALESCE((SELECT group_concat(t.title, ' ') FROM music_track t WHERE t.album_id = a.id), '')
+    FROM music_album a
+    JOIN music_artist ar ON ar.id = a.artist_id
+    LEFT JOIN music_recordlabel l ON l.id = a.record_label_id
+    LEFT JOIN music_genre g ON g.id = a.genre_id
+"""
+
+
+def fts_query(text):
+    """
+    Turn free text typed into a search box into an FTS5 MATCH expression.
+    Every word must match, and the last one is a prefix so results keep
+    up with the user while they type: "dark sid" -> "dark" "sid"*
+    Returns '' when the text has no searchable words.
+    """
+    tokens = TOKEN_RE.findall(text or '')
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_albums(queryset, text):
+    """Filter an Album queryset to full-text matches on title, artist, label, genre and tracks"""
+    expression = fts_query(text)
+    if not expression:
+        return queryset.filter(title__icontains=text)
+    return queryset.filter(search_index__document__match=expression)
+
+
+def search_artists(queryset, text):
+    """Filter an Artist queryset to full-text matches on name"""
+    expression = fts_query(text)
+    if not expression:
+        return queryset.filter(name__icontains=text)
+    return queryset.filter(search_index__document__match=expression)
+
+
+def _chunks(ids, size=500):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def index_albums(album_ids):
+    """(Re)index these albums; ids that no longer exist are dropped from the index"""
+    with connection.cursor() as cursor:
+        for chunk in _chunks(album_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM music_album_fts WHERE rowid IN ({placeholders})", chunk)
+            cursor.execute(
+                f"INSERT INTO music_album_fts(rowid, title, artist, label, genre, tracks) "
+                f"{ALBUM_DOCUMENT} WHERE a.id IN ({placeholders})",
+                chunk,
+            )
+
+
+def index_artists(artist_ids):
+    """(Re)index these artists; ids that no longer exist are dropped from the index"""
+    with connection.cursor() as cursor:
+        for chunk in _chunks(artist_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM music_artist_fts WHERE rowid IN ({placeholders})", chunk)
+            cursor.execute(
+                f"INSERT INTO music_artist_fts(rowid, name) SELECT id, name FROM music_artist WHERE id IN ({placeholders})",
+                chunk,
+            )
+
+
+def populate_search_index(cursor):
+    """Refill both FTS tables from the catalog tables, in the caller's transaction"""
+    cursor.execute("DELETE FROM music_album_fts")
+    cursor.execute(f"INSERT INTO music_album_fts(rowid, title, artist, label, genre, tracks) {ALBUM_DOCUMENT}")
+    album_count = cursor.rowcount
+    cursor.execute("DELETE FROM music_artist_fts")
+    cursor.execute("INSERT INTO music_artist_fts(rowid, name) SELECT id, name FROM music_artist")
+    return album_count, cursor.rowcount
+
+
+def rebuild_search_index():
+    """Repopulate both FTS tables from scratch; returns (albums, artists) indexed"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        album_count, artist_count = populate_search_index(cursor)
+
+    # Merge the index b-trees so lookups touch as few pages as possible
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO music_album_fts(music_album_fts) VALUES ('optimize')")
+        cursor.execute("INSERT INTO music_artist_fts(music_artist_fts) VALUES ('optimize')")
+
+    return album_count, artist_count
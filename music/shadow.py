@@ -0,0 +1,160 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from django.db import connection, connections
+from django.utils import timezone
+from .catalog import suppressed_catalog_bumps
+from .models import Album, Artist, Genre, ImportJournalEntry, ImportRun, RecordLabel, Track
+from .search import populate_search_index
+
+# Blue/green catalog imports.
+#
+# A long import can run against a shadow copy of the database instead of the
+# live one: snapshot() copies the live database with SQLite's online backup
+# API, use_database() points every new connection (including import worker
+# threads) at the copy, and swap_catalog() then replaces the live catalog
+# tables with the shadow's in a single write transaction. In WAL mode the
+# site keeps reading the old catalog until that transaction commits and sees
+# the whole new one afterwards, never a half-imported album.
+#
+# Only the catalog tables are swapped, so carts, checkouts, the email outbox,
+# sessions and users written on the live database meanwhile are untouched.
+# Cart items whose album disappeared in the import are dropped, as deleting
+# the album would have done. Catalog edits made on the live database during
+# the import would be lost, so the swap refuses when a catalog table's row
+# count or highest id moved, or a stamped row was saved, since the snapshot.
+# That catches anything done through the admin or the ORM; a raw UPDATE of
+# unstamped columns (e.g. a track title in SQL) can't be seen.
+#
+# The shadow shares the site's cache, so catalog version bumps are suppressed
+# while connections point at it and made once, after the swap.
+
+CATALOG_MODELS = [Genre, RecordLabel, Artist, Album, Track, ImportRun, ImportJournalEntry]
+# Models with updated_at, for spotting edits that leave the row counts alone
+STAMPED_MODELS = [Genre, RecordLabel, Artist, Album]
+
+# Row count and highest id of every catalog table, in one statement
+CATALOG_EXTENT_SQL = 'SELECT ' + ', '.join(
+    f"(SELECT COUNT(*) FROM {model._meta.db_table}), (SELECT MAX(id) FROM {model._meta.db_table})"
+    for model in CATALOG_MODELS
+)
+
+
+def catalog_extent(row):
+    """CATALOG_EXTENT_SQL's row as {table: (rows, max id)}"""
+    return {
+        model._meta.db_table: (row[2 * i], row[2 * i + 1])
+        for i, model in enumerate(CATALOG_MODELS)
+    }
+
+
+class LiveCatalogChanged(Exception):
+    """The live catalog was edited after the shadow copy was taken"""
+
+
+def snapshot(path):
+    """
+    Copy the live database to `path` (consistent, without blocking the
+    site); returns (taken_at, {table: (rows, max id)}) of the copy.
+    """
+    remove_database(path)
+    connection.ensure_connection()
+    taken_at = timezone.now()
+    target = sqlite3.connect(path)
+    try:
+        # One step: the copy is a single read transaction on the live database
+        connection.connection.backup(target)
+        tables = target.execute(CATALOG_EXTENT_SQL).fetchone()
+    finally:
+        target.close()
+    return taken_at, catalog_extent(tables)
+
+
+@contextmanager
+def use_database(path):
+    """
+    Point the default database (every thread's new connections) at `path`
+    for the duration, without invalidating the live site's cached pages.
+    """
+    settings_dict = connections.settings['default']
+    live_path = settings_dict['NAME']
+    connections.close_all()
+    settings_dict['NAME'] = path
+    try:
+        with suppressed_catalog_bumps():
+            yield
+    finally:
+        settings_dict['NAME'] = live_path
+        connections.close_all()
+
+
+def live_changes_since(taken_at, extent):
+    """
+    {table: description} of the live catalog's changes since the snapshot:
+    rows added or deleted, and stamped rows saved after `taken_at`
+    """
+    changes = {}
+    with connection.cursor() as cursor:
+        # Unqualified names find main before the attached shadow
+        cursor.execute(CATALOG_EXTENT_SQL)
+        live = catalog_extent(cursor.fetchone())
+    for table, (rows, max_id) in extent.items():
+        if live[table] != (rows, max_id):
+            changes[table] = f'rows {rows} -> {live[table][0]}, max id {max_id} -> {live[table][1]}'
+    for model in STAMPED_MODELS:
+        count = model.objects.filter(updated_at__gt=taken_at).count()
+        if count:
+            table = model._meta.db_table
+            changes[table] = ', '.join(filter(None, [changes.get(table), f'{count} saved']))
+    return changes
+
+
+def swap_catalog(path, taken_at, extent, force=False):
+    """
+    Replace the live catalog tables with the shadow database's in one
+    transaction; returns {table: rows}. Raises LiveCatalogChanged (and
+    changes nothing) if the live catalog changed since the snapshot (see
+    live_changes_since), unless force is set.
+    """
+    connections.close_all()
+    with connection.cursor() as cursor:
+        cursor.execute("ATTACH DATABASE %s AS shadow", [path])
+        # SQLite's deferred foreign key bookkeeping miscounts a whole-table
+        # DELETE + INSERT like this one, so check the result explicitly instead
+        connection.disable_constraint_checking()
+        try:
+            # IMMEDIATE: take the write lock before the check below reads anything
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                changes = live_changes_since(taken_at, extent)
+                if changes and not force:
+                    raise LiveCatalogChanged(
+                        ', '.join(f'{table}: {count}' for table, count in changes.items())
+                    )
+                counts = {}
+                for model in CATALOG_MODELS:
+                    table = model._meta.db_table
+                    cursor.execute(f"DELETE FROM main.{table}")
+                    cursor.execute(f"INSERT INTO main.{table} SELECT * FROM shadow.{table}")
+                    counts[table] = cursor.rowcount
+                # Deleting an album cascades to cart items; do the same for albums the import dropped
+                cursor.execute(
+                    "DELETE FROM main.music_cartitem WHERE album_id NOT IN (SELECT id FROM main.music_album)"
+                )
+                populate_search_index(cursor)
+                connection.check_constraints()
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        finally:
+            connection.enable_constraint_checking()
+            cursor.execute("DETACH DATABASE shadow")
+    return counts
+
+
+def remove_database(path):
+    """Delete a database file and its WAL companions"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(f'{path}{suffix}'):
+            os.remove(f'{path}{suffix}')
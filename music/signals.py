@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .catalog import bump_catalog_version
+from .media import release_media
+from .models import Album, Artist, Genre, RecordLabel, Track
+from .search import index_albums, index_artists
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=RecordLabel)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=RecordLabel)
+def catalog_changed(sender, **kwargs):
+    """Bump the catalog version once the change is visible to other workers"""
+    transaction.on_commit(bump_catalog_version)
+
+
+# -------------------------
+# Modification stamps
+# -------------------------
+# An album page shows its tracks, artist, genre and label, so changing any of
+# them touches the album's updated_at (the validator for its conditional GETs).
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def touch_track_album(sender, instance, **kwargs):
+    Album.objects.filter(pk=instance.album_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Artist)
+def touch_artist_albums(sender, instance, **kwargs):
+    instance.albums.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=RecordLabel)
+def touch_dimension_albums(sender, instance, **kwargs):
+    instance.album_set.update(updated_at=timezone.now())
+
+
+# -------------------------
+# Search index
+# -------------------------
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def reindex_album(sender, instance, **kwargs):
+    index_albums([instance.pk])
+
+
+@receiver(post_save, sender=Track)
+@receiver(post_delete, sender=Track)
+def reindex_track_album(sender, instance, **kwargs):
+    index_albums([instance.album_id])
+
+
+@receiver(post_save, sender=Artist)
+def reindex_artist(sender, instance, **kwargs):
+    index_artists([instance.pk])
+    index_albums(instance.albums.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Artist)
+def unindex_artist(sender, instance, **kwargs):
+    index_artists([instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=RecordLabel)
+def reindex_dimension_albums(sender, instance, **kwargs):
+    index_albums(instance.album_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=RecordLabel)
+def remember_dimension_albums(sender, instance, **kwargs):
+    # Deleting nulls the albums' foreign key, so note which ones to reindex
+    instance._album_ids = list(instance.album_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=RecordLabel)
+def reindex_orphaned_albums(sender, instance, **kwargs):
+    album_ids = getattr(instance, '_album_ids', [])
+    albums = Album.objects.filter(id__in=album_ids)
+    if sender is Genre:
+        albums.update(genre_sort=None, updated_at=timezone.now())
+    else:
+        albums.update(updated_at=timezone.now())
+    index_albums(album_ids)
+
+
+# -------------------------
+# Media references
+# -------------------------
+# Covers and artist images are content-addressed and shared, so a file is
+# only deleted (after the commit) once no album or artist refers to it.
+
+MEDIA_FIELDS = {Album: 'cover_image', Artist: 'image'}
+
+
+@receiver(pre_save, sender=Album)
+@receiver(pre_save, sender=Artist)
+def remember_media(sender, instance, update_fields=None, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    instance._stored_media = None
+    if not instance.pk or not (update_fields is None or field in update_fields):
+        return
+    # Known from when the row was loaded; only instances built by hand need the query
+    missing = object()
+    instance._stored_media = instance.loaded_value(field, missing)
+    if instance._stored_media is missing:
+        instance._stored_media = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+def release_replaced_media(sender, instance, **kwargs):
+    previous = getattr(instance, '_stored_media', None)
+    if previous and previous != getattr(instance, MEDIA_FIELDS[sender]).name:
+        transaction.on_commit(lambda: release_media(previous))
+
+
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+def release_deleted_media(sender, instance, **kwargs):
+    name = getattr(instance, MEDIA_FIELDS[sender]).name
+    if name:
+        transaction.on_commit(lambda: release_media(name))
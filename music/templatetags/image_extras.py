@@ -0,0 +1,23 @@
+from django import template
+from music.images import derivative_urls
+
+register = template.Library()
+
+# Tailwind grid widths of the album/artist card grids, as a sizes attribute
+CARD_SIZES = '(min-width: 1280px) 20vw, (min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+
+@register.inclusion_tag('partials/responsive_image.html')
+def responsive_image(image, alt='', css_class='', sizes=CARD_SIZES):
+    """<picture> for an ImageField with WebP/JPEG srcsets of its recorded derivatives"""
+    def srcset(extension):
+        return ', '.join(f'{url} {width}w' for url, width in derivative_urls(image, extension))
+
+    return {
+        'image': image,
+        'alt': alt,
+        'css_class': css_class,
+        'sizes': sizes,
+        'webp_srcset': srcset('webp'),
+        'jpg_srcset': srcset('jpg'),
+    }
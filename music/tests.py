@@ -1,3 +1,872 @@
-from django.test import TestCase
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from smtplib import SMTPException
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import shadow
+from .cache import SQLiteCache
+from .catalog import bump_catalog_version, catalog_version
+from .dedupe import apply_merge_plan, find_clusters
+from .discogs import RETRY_AFTER, CachedResponse, RateLimitedFetcher, RateLimiter, ReplayMiss, ResponseCache
+from .downloads import DownloadError, ImageDownloader
+from .management.commands.import_discogs import Command as ImportDiscogsCommand
+from .management.commands.import_phpcds import stream_table_rows
+from .media import serve_media
+from .models import (
+    Album, Artist, Cart, CartItem, Checkout, Genre, ImportJournalEntry, ImportRun, OutboxMessage, RecordLabel, Track,
+)
+from .outbox import RETRY_BASE, send_due
+from .pagination import InvalidCursor, keyset_page
+from .rendering import clean_discogs_markup
+from .search import search_albums, search_artists
 
-# Create your tests here.
+
+class IsolatedCacheMixin:
+    """Give the test class its own cache file, so tests never read or write cache.sqlite3"""
+
+    @classmethod
+    def setUpClass(cls):
+        cache_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cache_dir.cleanup)
+        cls.enterClassContext(override_settings(CACHES={
+            'default': {
+                'BACKEND': 'music.cache.SQLiteCache',
+                'LOCATION': Path(cache_dir.name) / 'cache.sqlite3',
+            },
+        }))
+        # One music.timing line per request is noise here; over-budget warnings still show
+        timing = logging.getLogger('music.timing')
+        cls.addClassCleanup(timing.setLevel, timing.level)
+        timing.setLevel(logging.WARNING)
+        super().setUpClass()
+
+
+class CatalogTestCase(IsolatedCacheMixin, TestCase):
+    pass
+
+
+def make_album(title, artist_name, **fields):
+    artist, _ = Artist.objects.get_or_create(name=artist_name)
+    return Album.objects.create(title=title, artist=artist, **fields)
+
+
+class SortKeyTests(CatalogTestCase):
+    """Album's denormalized sort keys follow renames without extra writes on plain saves"""
+
+    def test_renames_propagate(self):
+        album = make_album('Doolittle', 'Pixies', genre=Genre.objects.create(name='Alternative'))
+        artist = Artist.objects.get()
+        artist.name = 'The Pixies'
+        artist.save()
+        genre = Genre.objects.get()
+        genre.name = 'Indie'
+        genre.save()
+        self.assertEqual(
+            Album.objects.values_list('artist_sort', 'genre_sort').get(pk=album.pk), ('the pixies', 'indie')
+        )
+
+    def test_album_moves_update_its_keys(self):
+        album = Album.objects.get(pk=make_album('Doolittle', 'Pixies').pk)
+        album.artist_id = Artist.objects.create(name='Breeders').pk
+        album.save()
+        self.assertEqual(Album.objects.get(pk=album.pk).artist_sort, 'breeders')
+
+    def test_plain_saves_skip_the_lookups(self):
+        make_album('Doolittle', 'Pixies')
+        album = Album.objects.get()
+        with CaptureQueriesContext(connection) as captured:
+            album.save()
+        self.assertFalse([q for q in captured if 'FROM "music_artist"' in q['sql']])
+        artist = Artist.objects.get()
+        with CaptureQueriesContext(connection) as captured:
+            artist.save()
+        self.assertFalse([q for q in captured if 'artist_sort' in q['sql']])
+
+
+class BioRenderingTests(CatalogTestCase):
+    def test_bio_is_rendered_only_when_it_changes(self):
+        Artist.objects.create(name='Pixies', bio='From *Boston*')
+        artist = Artist.objects.get()
+        self.assertEqual(artist.bio_html, '<p>From <em>Boston</em></p>')
+        with mock.patch('music.models.render_markdown') as render:
+            artist.website = 'https://pixies.com'
+            artist.save()
+            render.assert_not_called()
+        artist.bio = 'From **Boston**'
+        artist.save()
+        self.assertEqual(Artist.objects.get().bio_html, '<p>From <strong>Boston</strong></p>')
+
+
+class MediaReferenceTests(CatalogTestCase):
+    def test_saves_dont_reread_the_stored_image(self):
+        album = Album.objects.get(pk=make_album('Doolittle', 'Pixies').pk)
+        with CaptureQueriesContext(connection) as captured:
+            album.save()
+        self.assertFalse([q for q in captured if q['sql'].startswith('SELECT "music_album"."cover_image"')])
+        self.assertEqual(album._stored_media, '')
+
+
+class CartCountCookieTests(CatalogTestCase):
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('collection'))
+        return response, [q for q in captured if 'COUNT(' in q['sql'] and 'music_cartitem' in q['sql']]
+
+    def test_a_missing_count_is_queried_once(self):
+        cart = Cart.objects.create(cookie_id='returning-visitor')
+        CartItem.objects.create(cart=cart, album=make_album('Doolittle', 'Pixies'))
+        self.client.cookies['cart_id'] = 'returning-visitor'
+
+        response, counts = self.count_queries()
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(response.context['cart_item_count'](), 1)
+        self.assertIn('cart_count', response.cookies)
+
+        response, counts = self.count_queries()
+        self.assertEqual(counts, [])
+        self.assertEqual(response.context['cart_item_count'], 1)
+        self.assertNotIn('cart_count', response.cookies)
+
+
+class PurgeCartsTests(TestCase):
+    def test_only_abandoned_carts_are_purged(self):
+        album = make_album('Doolittle', 'Pixies')
+        carts = {}
+        for name in ['abandoned', 'fresh', 'checked out']:
+            carts[name] = Cart.objects.create(cookie_id=name)
+            CartItem.objects.create(cart=carts[name], album=album)
+        Checkout.objects.create(cart=carts['checked out'], name='Kim', mailing_address='1 Main St')
+        old = timezone.now() - timedelta(days=31)
+        Cart.objects.exclude(pk=carts['fresh'].pk).update(updated_at=old)
+
+        call_command('purge_carts', pause=0, stdout=StringIO())
+
+        self.assertEqual(set(Cart.objects.values_list('cookie_id', flat=True)), {'fresh', 'checked out'})
+        self.assertEqual(set(CartItem.objects.values_list('cart__cookie_id', flat=True)), {'fresh', 'checked out'})
+
+
+class SearchIndexTests(CatalogTestCase):
+    """The FTS tables follow the catalog through model signals"""
+
+    def found(self, text):
+        return list(search_albums(Album.objects.all(), text).values_list('title', flat=True))
+
+    def test_index_follows_saves_and_deletes(self):
+        album = make_album('Doolittle', 'Pixies', genre=Genre.objects.create(name='Alternative'))
+        Track.objects.create(album=album, title='Monkey Gone to Heaven', track_number=7)
+        self.assertEqual(self.found('doolit'), ['Doolittle'])
+        self.assertEqual(self.found('alternative'), ['Doolittle'])
+        self.assertEqual(self.found('monkey heaven'), ['Doolittle'])
+
+        album.artist.name = 'The Pixies'
+        album.artist.save()
+        self.assertEqual(list(search_artists(Artist.objects.all(), 'the pix').values_list('name', flat=True)), ['The Pixies'])
+        self.assertEqual(self.found('the pixies'), ['Doolittle'])
+
+        album.delete()
+        self.assertEqual(self.found('doolittle'), [])
+
+
+class FragmentCacheKeyTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_album('Radetzky March', 'Johann Strauß')
+
+    def get_html(self, **params):
+        return self.client.get(reverse('collection_ajax'), params).json()['html']
+
+    def test_equivalent_filters_share_a_result(self):
+        first = self.get_html(artist='  JOHANN   strauß ')
+        self.assertIn('Radetzky March', first)
+        self.assertEqual(self.get_html(artist='johann strauß'), first)
+
+    def test_filters_with_different_results_never_share_a_cache_entry(self):
+        # LIKE doesn't fold ß to ss, so these must not be served the same payload
+        self.assertIn('Radetzky March', self.get_html(artist='Strauß'))
+        self.assertNotIn('Radetzky March', self.get_html(artist='Strauss'))
+
+        self.assertNotIn('Radetzky March', self.get_html(q='Strauss'))
+        self.assertIn('Radetzky March', self.get_html(q='Strauß'))
+
+
+def original_clean_discogs_markup(text):
+    """cleanup_discogs_data's cleaner before it moved to music.rendering, verbatim"""
+    if not text:
+        return text
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'\[a=([^\]]+?)\s*\(\d+\)\]', r'\1', text)
+    text = re.sub(r'\[a=([^\]]+)\]', r'\1', text)
+    text = re.sub(r'\[a\d+\]', '', text)
+    text = re.sub(r'\[url=[^\]]+\]([^\[]+)\[/url\]', r'\1', text)
+    text = re.sub(r'\[l=([^\]]+)\]', r'\1', text)
+    text = re.sub(r'\[r=?\d*\]', '', text)
+    text = re.sub(r'  +', ' ', text)
+    text = re.sub(r'\n\n+', '\n\n', text)
+    return text.strip()
+
+
+class CleanDiscogsMarkupTests(TestCase):
+    TOKENS = [
+        '[a=King Diamond (2)]', '[a=Mercyful Fate]', '[a=', '[a151718]', '[a', '[l=Metalheadz]', '[l=',
+        '[r=123]', '[r]', '[r=', '[url=http://x]', '[url=]', '[url=', '[/url]', '[', ']', '(2)', ' (3)',
+        'text', 'te[xt', 'a', 'l=', 'url=x', '=', '123', ' ', '  ', '\n', '\n\n\n', '\r\n', '\r',
+    ]
+
+    def test_examples(self):
+        self.assertEqual(
+            clean_discogs_markup('Formed by [a=King Diamond (2)]  and [a=Hank Shermann]\r\n\r\n\r\n'
+                                 'on [l=Roadrunner Records] [a151718][r=123]. [url=http://x.com]Site[/url]'),
+            'Formed by King Diamond and Hank Shermann\n\non Roadrunner Records . Site',
+        )
+        self.assertEqual(clean_discogs_markup(''), '')
+        self.assertIsNone(clean_discogs_markup(None))
+
+    def test_matches_the_original_cleaner(self):
+        rng = random.Random(19)
+        for _ in range(20000):
+            text = ''.join(rng.choices(self.TOKENS, k=rng.randint(1, 12)))
+            self.assertEqual(clean_discogs_markup(text), original_clean_discogs_markup(text), repr(text))
+
+
+class ShadowImportTests(IsolatedCacheMixin, TransactionTestCase):
+    """The swap itself; the shadow is edited directly in place of running an import"""
+
+    def setUp(self):
+        self.kept = make_album('Doolittle', 'Pixies')
+        self.dropped = make_album('Surfer Rosa', 'Pixies')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'db.shadow.sqlite3')
+        self.taken_at, self.extent = shadow.snapshot(self.path)
+
+    def edit_shadow(self, *statements):
+        db = sqlite3.connect(self.path)
+        with db:
+            for sql, params in statements:
+                db.execute(sql, params)
+        db.close()
+
+    def test_swap_replaces_the_catalog_and_keeps_carts_and_checkouts(self):
+        self.edit_shadow(
+            ("UPDATE music_album SET title = 'Doolittle (Remaster)' WHERE id = ?", [self.kept.pk]),
+            ("DELETE FROM music_album WHERE id = ?", [self.dropped.pk]),
+        )
+        # Written on the live database while the import ran
+        cart = Cart.objects.create(cookie_id='during-import')
+        CartItem.objects.create(cart=cart, album=self.kept)
+        CartItem.objects.create(cart=cart, album=self.dropped)
+        Checkout.objects.create(cart=cart, name='Kim', mailing_address='1 Main St')
+
+        counts = shadow.swap_catalog(self.path, self.taken_at, self.extent)
+
+        self.assertEqual(counts['music_album'], 1)
+        self.assertEqual(Album.objects.get().title, 'Doolittle (Remaster)')
+        self.assertEqual(list(CartItem.objects.values_list('album', flat=True)), [self.kept.pk])
+        self.assertTrue(Checkout.objects.filter(cart=cart).exists())
+        self.assertEqual(list(search_albums(Album.objects.all(), 'remaster')), [self.kept])
+
+    def test_swap_refuses_after_a_live_edit(self):
+        self.kept.save()
+        with self.assertRaises(shadow.LiveCatalogChanged):
+            shadow.swap_catalog(self.path, self.taken_at, self.extent)
+
+    def test_swap_refuses_after_a_live_delete(self):
+        Track.objects.create(album=self.kept, title='Debaser', track_number=1)
+        taken_at, extent = shadow.snapshot(self.path)
+        # No stamp is left behind; only the row count shows it
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM music_track')
+        with self.assertRaises(shadow.LiveCatalogChanged):
+            shadow.swap_catalog(self.path, taken_at, extent)
+        self.assertEqual(shadow.swap_catalog(self.path, taken_at, extent, force=True)['music_track'], 1)
+
+    def test_shadow_writes_leave_the_live_catalog_version_alone(self):
+        version = catalog_version()
+        with shadow.use_database(self.path):
+            bump_catalog_version()
+        self.assertEqual(catalog_version(), version)
+        bump_catalog_version()
+        self.assertNotEqual(catalog_version(), version)
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def pages(self, queryset, per_page=2):
+        pages, cursor = [], None
+        while True:
+            items, cursor = keyset_page(queryset, cursor, per_page)
+            pages.append([item.pk for item in items])
+            if cursor is None:
+                return pages
+
+    def test_ties_and_nulls_are_neither_skipped_nor_repeated(self):
+        for released in [None, date(1989, 4, 17), None, date(1989, 4, 17), date(1988, 3, 21), None, None]:
+            make_album('Doolittle', 'Pixies', release_date=released)
+        for ordering in [('title_sort', 'id'), ('-release_date', '-id'), ('release_date', 'id')]:
+            queryset = Album.objects.order_by(*ordering)
+            with self.subTest(ordering=ordering):
+                pages = self.pages(queryset)
+                self.assertEqual(sum(pages, []), list(queryset.values_list('pk', flat=True)))
+                self.assertTrue(all(len(page) == 2 for page in pages[:-1]))
+
+    def test_cursors_only_work_for_their_ordering(self):
+        for title in ['A', 'B', 'C']:
+            make_album(title, 'Pixies')
+        _, cursor = keyset_page(Album.objects.order_by('title_sort', 'id'), per_page=1)
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Album.objects.order_by('-id'), cursor, 1)
+
+    def test_a_tampered_cursor_is_a_bad_request(self):
+        make_album('Doolittle', 'Pixies')
+        response = self.client.get(reverse('collection_ajax'), {'sort': 'title', 'cursor': 'WyJkb29saXR0bGUiLDFd:tampered'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SQLiteCacheTests(TestCase):
+    def make_cache(self, **options):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return SQLiteCache(Path(directory.name) / 'cache.sqlite3', {'OPTIONS': options})
+
+    def test_get_or_set_computes_once(self):
+        cache = self.make_cache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'fresh'
+
+        self.assertEqual(cache.get_or_set('key', compute), 'fresh')
+        self.assertEqual(cache.get_or_set('key', compute), 'fresh')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_serves_stale_while_another_worker_recomputes(self):
+        cache = self.make_cache()
+        cache.set('key', 'stale', timeout=0)
+        cache.add('key:lock', 'other worker')
+        self.assertEqual(cache.get_or_set('key', lambda: 'fresh'), 'stale')
+        cache.delete('key:lock')
+        self.assertEqual(cache.get_or_set('key', lambda: 'fresh'), 'fresh')
+        self.assertFalse(cache.has_key('key:lock'))
+
+    def test_culls_least_recently_used_entries(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for key in 'abcd':
+            cache.set(key, key)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual([cache.get(key) for key in 'bcd'], ['b', 'c', 'd'])
+
+    def test_culls_to_max_bytes(self):
+        cache = self.make_cache(MAX_BYTES=128 * 1024)
+        for i in range(64):
+            cache.set(i, random.randbytes(8 * 1024))
+        self.assertLessEqual(cache._used_bytes(cache._connection()), 128 * 1024)
+        self.assertIsNone(cache.get(0))
+        self.assertIsNotNone(cache.get(63))
+
+
+class ServeMediaTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+        for name in ['images/ab/cd/abcd.jpg', 'album_covers/Pixies Doolittle.jpg']:
+            path = Path(directory.name) / name
+            path.parent.mkdir(parents=True)
+            path.write_bytes(b'0123456789')
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        return serve_media(self.factory.get(f'/media/{path}', headers=headers), path)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get('images/ab/cd/abcd.jpg')
+        self.assertEqual((response.status_code, self.body(response)), (200, b'0123456789'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        # Not content-addressed: only cached for good under its ?v= URL
+        self.assertNotIn('immutable', self.get('album_covers/Pixies Doolittle.jpg')['Cache-Control'])
+
+    def test_revalidation(self):
+        etag = self.get('images/ab/cd/abcd.jpg')['ETag']
+        self.assertEqual(self.get('images/ab/cd/abcd.jpg', if_none_match=etag).status_code, 304)
+
+    def test_byte_ranges(self):
+        for header, content_range, body in [
+            ('bytes=2-5', 'bytes 2-5/10', b'2345'),
+            ('bytes=7-', 'bytes 7-9/10', b'789'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+            ('bytes=8-100', 'bytes 8-9/10', b'89'),
+        ]:
+            with self.subTest(header):
+                response = self.get('images/ab/cd/abcd.jpg', range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual((response['Content-Range'], self.body(response)), (content_range, body))
+                self.assertEqual(response['Content-Length'], str(len(body)))
+
+    def test_unsatisfiable_range(self):
+        response = self.get('images/ab/cd/abcd.jpg', range='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        response = self.get('images/ab/cd/abcd.jpg', range='bytes=2-5', if_range='"old"')
+        self.assertEqual((response.status_code, self.body(response)), (200, b'0123456789'))
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect_hands_off_a_quoted_path(self):
+        response = self.get('album_covers/Pixies Doolittle.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/album_covers/Pixies%20Doolittle.jpg')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root(self):
+        with self.assertRaises(Http404):
+            self.get('../settings.py')
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        self.album = make_album('Doolittle', 'Pixies')
+        self.url = reverse('album_detail', args=[self.album.pk, self.album.slug])
+
+    def test_unchanged_pages_are_not_modified(self):
+        self.client.get(self.url)  # picks up the CSRF cookie, which is part of the ETag
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Track.objects.create(album=self.album, title='Debaser', track_number=1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_visitor_cookies_change_the_etag(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.client.cookies['cart_id'] = 'someone'
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping just moves the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.enterContext(mock.patch('music.discogs.time', self.clock))
+
+    def test_bursts_then_paces_at_the_rate(self):
+        limiter = RateLimiter(per_minute=60, burst=3)
+        for _ in range(5):
+            limiter.acquire()
+        self.assertEqual(self.clock.slept, [1.0, 1.0])
+
+    def test_follows_the_servers_limit_and_remaining_count(self):
+        limiter = RateLimiter(per_minute=60, burst=3)
+        limiter.observe({'X-Discogs-Ratelimit': '120', 'X-Discogs-Ratelimit-Remaining': '0'})
+        limiter.acquire()
+        self.assertEqual(self.clock.slept, [0.5])
+
+    def test_pause_holds_everything_back(self):
+        limiter = RateLimiter(per_minute=60, burst=3)
+        limiter.pause(10)
+        limiter.acquire()
+        self.assertEqual(sum(self.clock.slept), 10)
+
+    def test_fetcher_waits_out_a_429(self):
+        limiter = RateLimiter(per_minute=60, burst=3)
+        fetcher = RateLimitedFetcher('token', limiter, ResponseCache(mode='off'))
+        fetcher.local.session = mock.Mock()
+        fetcher.local.session.request.side_effect = [
+            mock.Mock(status_code=429, headers={}),
+            mock.Mock(status_code=200, headers={}),
+        ]
+        self.assertEqual(fetcher.send('GET', 'https://api.discogs.com/releases/1', None, {}).status_code, 200)
+        self.assertEqual(fetcher.local.session.request.call_count, 2)
+        self.assertGreaterEqual(sum(self.clock.slept), RETRY_AFTER)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'discogs': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'discogs'},
+})
+class ResponseCacheTests(SimpleTestCase):
+    URL = 'https://api.discogs.com/releases/249504'
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.enterContext(mock.patch('music.discogs.time', self.clock))
+        self.addCleanup(caches['discogs'].clear)
+        self.sent = []
+
+    def send(self, status=200):
+        def send():
+            self.sent.append(status)
+            return CachedResponse(status, {'Content-Type': 'application/json'}, b'{"id": 249504}')
+        return send
+
+    def test_use_serves_fresh_entries_and_refetches_stale_ones(self):
+        responses = ResponseCache('use', ttl=60)
+        responses.fetch(self.URL, self.send(), {'token': 'a'})
+        response = responses.fetch(self.URL, self.send(), {'token': 'b'})  # the token isn't part of the key
+        self.assertEqual((response.status_code, response.content), (200, b'{"id": 249504}'))
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(self.sent, [200])
+
+        self.clock.now += 61
+        responses.fetch(self.URL, self.send())
+        self.assertEqual(self.sent, [200, 200])
+
+    def test_replay_serves_any_age_and_never_fetches(self):
+        ResponseCache('refresh').fetch(self.URL, self.send())
+        self.clock.now += 10 ** 9
+        replay = ResponseCache('replay', ttl=60)
+        self.assertEqual(replay.fetch(self.URL, self.send()).status_code, 200)
+        with self.assertRaises(ReplayMiss):
+            replay.fetch(self.URL + '0', self.send())
+        self.assertEqual(self.sent, [200])
+
+    def test_refresh_and_off_always_fetch(self):
+        for mode in ['refresh', 'refresh', 'off']:
+            ResponseCache(mode).fetch(self.URL, self.send())
+        self.assertEqual(len(self.sent), 3)
+        self.assertIsNone(ResponseCache('off').cached(self.URL))
+
+    def test_only_answers_worth_repeating_are_recorded(self):
+        responses = ResponseCache('use')
+        for status in [404, 500, 429]:
+            responses.fetch(f'{self.URL}/{status}', self.send(status))
+            responses.fetch(f'{self.URL}/{status}', self.send(status))
+        self.assertEqual(self.sent, [404, 500, 500, 429, 429])
+
+
+class ImportJournalTests(TestCase):
+    def setUp(self):
+        for title in ['Come On Pilgrim', 'Surfer Rosa', 'Doolittle', 'Bossanova']:
+            make_album(title, 'Pixies')
+        self.processed = []
+        self.outcomes = {'Surfer Rosa': (ImportJournalEntry.FAILED, 'Cover image: timed out')}
+        self.enterContext(mock.patch('music.management.commands.import_discogs.make_client'))
+        self.enterContext(mock.patch.object(ImportDiscogsCommand, 'update_album_from_discogs', self.update))
+
+    def update(self, album, discogs_client, discogs_release_id=None):
+        if album.title == self.interrupt_at:
+            raise KeyboardInterrupt
+        self.processed.append(album.title)
+        return self.outcomes.get(album.title, (ImportJournalEntry.DONE, ''))
+
+    def import_discogs(self, *args):
+        call_command('import_discogs', *args, '--cache', 'off', stdout=StringIO())
+
+    def test_resume_continues_where_the_run_stopped(self):
+        self.interrupt_at = 'Doolittle'
+        with self.assertRaises(KeyboardInterrupt):
+            self.import_discogs('--all')
+        run = ImportRun.objects.get()
+        self.assertEqual(
+            dict(run.entries.values_list('album__title', 'status')),
+            {'Come On Pilgrim': ImportJournalEntry.DONE, 'Surfer Rosa': ImportJournalEntry.FAILED},
+        )
+
+        self.interrupt_at = None
+        self.processed = []
+        self.import_discogs('--resume', str(run.pk))
+        self.assertEqual(self.processed, ['Doolittle', 'Bossanova'])
+        self.assertIsNotNone(ImportRun.objects.get().finished_at)
+
+        self.processed = []
+        del self.outcomes['Surfer Rosa']
+        self.import_discogs('--retry-failed')
+        self.assertEqual(self.processed, ['Surfer Rosa'])
+        self.assertEqual(set(run.entries.values_list('status', flat=True)), {ImportJournalEntry.DONE})
+        self.assertEqual(run.entries.count(), 4)
+
+
+class ImportPhpcdsTests(CatalogTestCase):
+    """--bulk must leave the same catalog as the default import (run on the bundled exports)"""
+
+    EXPORTS = Path(__file__).resolve().parent.parent
+
+    def setUp(self):
+        self.enterContext(contextlib.chdir(self.EXPORTS))
+
+    def import_phpcds(self, *args):
+        # Something already in the catalog, which both modes must reuse
+        make_album('Orblivion', 'Orb')
+        call_command('import_phpcds', *args, stdout=StringIO())
+        catalog = {
+            'genres': set(Genre.objects.values_list('name', 'description')),
+            'labels': set(RecordLabel.objects.values_list('name', flat=True)),
+            'artists': set(Artist.objects.values_list('name', 'slug', 'bio_html')),
+            'albums': sorted(Album.objects.values_list(
+                'title', 'slug', 'artist__name', 'genre__name', 'release_date', 'number_of_discs',
+                'record_label__name', 'title_sort', 'artist_sort', 'genre_sort',
+            ), key=repr),
+            'found': sorted(search_albums(Album.objects.all(), 'diamond').values_list('title', flat=True)),
+        }
+        for model in [Album, Artist, Genre, RecordLabel]:
+            model.objects.all().delete()
+        return catalog
+
+    def test_bulk_matches_the_default_import(self):
+        default = self.import_phpcds()
+        self.assertGreater(len(default['albums']), 200)
+        self.assertTrue(default['found'])
+        bulk = self.import_phpcds('--bulk', '--batch-size', '7')
+        for part in default:
+            self.assertEqual(bulk[part], default[part], part)
+
+    def test_streamed_rows_match_the_parsed_export(self):
+        with open('cds.json') as f:
+            [rows] = [item['data'] for item in json.load(f) if item.get('name') == 'cds']
+        self.assertEqual(list(stream_table_rows('cds.json', 'cds', chunk_size=97)), rows)
+
+
+class TracklistSyncTests(CatalogTestCase):
+    def setUp(self):
+        self.album = make_album('Doolittle', 'Pixies')
+        self.kept = Track.objects.create(album=self.album, title='Debaser', track_number=1, duration='2:52')
+        self.retimed = Track.objects.create(album=self.album, title='Tame', track_number=2, duration='1:50')
+        Track.objects.create(album=self.album, title='Bonus', track_number=4)
+        self.command = ImportDiscogsCommand(stdout=StringIO())
+
+    def tracklist(self, *rows):
+        return [SimpleNamespace(position=position, title=title, duration=duration) for position, title, duration in rows]
+
+    def test_only_differing_tracks_are_written(self):
+        tracklist = self.tracklist(('1', 'Debaser', '2:52'), ('2', 'Tame', '1:55'), ('3', 'Wave of Mutilation', '2:04'))
+        self.command.update_tracklist(self.album, tracklist)
+
+        self.assertEqual(
+            list(self.album.tracks.values_list('id', 'track_number', 'title', 'duration'))[:2],
+            [(self.kept.pk, 1, 'Debaser', '2:52'), (self.retimed.pk, 2, 'Tame', '1:55')],
+        )
+        self.assertEqual(list(self.album.tracks.values_list('title', flat=True)), ['Debaser', 'Tame', 'Wave of Mutilation'])
+        self.assertEqual(list(search_albums(Album.objects.all(), 'mutilation')), [self.album])
+        self.assertGreater(Album.objects.get().updated_at, self.album.updated_at)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.command.update_tracklist(self.album, tracklist)
+        self.assertEqual([q['sql'] for q in captured if not q['sql'].startswith('SELECT')], [])
+
+    def test_vinyl_sides_are_numbered_in_order(self):
+        rows = self.command.tracklist_rows(self.tracklist(('A1', 'Debaser', ''), ('A2', 'Tame', ''), ('B1', 'Hey', '')))
+        self.assertEqual([number for number, _, _ in rows], [1, 2, 3])
+
+
+class FakeImageResponse:
+    def __init__(self, body, content_type='image/jpeg', length=True, status_code=200):
+        self.status_code = status_code
+        self.headers = {'Content-Type': content_type}
+        if length:
+            self.headers['Content-Length'] = str(len(body))
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), 4):
+            yield self.body[start:start + 4]
+
+
+class ImageDownloaderTests(SimpleTestCase):
+    URL = 'https://i.discogs.com/cover.jpg'
+
+    def make_downloader(self, response, **options):
+        responses = mock.Mock(spec=ResponseCache)
+        responses.cached.return_value = None
+        downloader = ImageDownloader(responses, max_bytes=16, **options)
+        self.addCleanup(downloader.close)
+        downloader.local.session = mock.Mock()
+        downloader.local.session.get.return_value = response
+        return downloader, responses
+
+    def test_streams_the_body_into_a_file(self):
+        downloader, responses = self.make_downloader(FakeImageResponse(b'\xff\xd8 jpeg body'))
+        image = downloader.fetch(self.URL)
+        self.addCleanup(image.close)
+        self.assertEqual(image.read(), b'\xff\xd8 jpeg body')
+        self.assertTrue(downloader.local.session.get.call_args.kwargs['stream'])
+        responses.record.assert_not_called()
+
+    def test_records_bodies_only_when_asked(self):
+        downloader, responses = self.make_downloader(FakeImageResponse(b'jpeg body'), record_images=True)
+        downloader.fetch(self.URL).close()
+        url, recorded = responses.record.call_args.args
+        self.assertEqual((url, recorded.content), (self.URL, b'jpeg body'))
+
+    def test_serves_recorded_images_without_downloading(self):
+        downloader, responses = self.make_downloader(None)
+        responses.cached.return_value = CachedResponse(200, {'Content-Type': 'image/png'}, b'png body')
+        image = downloader.fetch(self.URL)
+        self.addCleanup(image.close)
+        self.assertEqual(image.read(), b'png body')
+        downloader.local.session.get.assert_not_called()
+
+    def test_rejects_errors_non_images_and_oversized_bodies(self):
+        for response in [
+            FakeImageResponse(b'', status_code=404),
+            FakeImageResponse(b'<html>', content_type='text/html'),
+            FakeImageResponse(b'x' * 17),
+            FakeImageResponse(b'x' * 17, length=False),  # only caught while streaming
+        ]:
+            with self.subTest(headers=response.headers, status=response.status_code):
+                downloader, _ = self.make_downloader(response)
+                with self.assertRaises(DownloadError):
+                    downloader.fetch(self.URL)
+
+
+class DedupeTests(CatalogTestCase):
+    def test_similar_names_cluster_around_the_busiest_row(self):
+        make_album('Doolittle', 'Pixies', record_label=RecordLabel.objects.create(name='4AD'))
+        label = RecordLabel.objects.get()
+        make_album('Surfer Rosa', 'Pixies', record_label=label)
+        make_album('Pod', 'Breeders', record_label=RecordLabel.objects.create(name='4AD Records'))
+        make_album('Loveless', 'My Bloody Valentine', record_label=RecordLabel.objects.create(name='Creation'))
+
+        [cluster] = find_clusters(RecordLabel)
+        self.assertEqual(cluster['keep'], label.pk)
+        self.assertEqual(cluster['merge'], [RecordLabel.objects.get(name='4AD Records').pk])
+
+    def test_merge_moves_albums_and_keeps_sort_keys_and_search_in_step(self):
+        kept = Artist.objects.create(name='Pixies')
+        merged = Artist.objects.create(name='The Pixies (2)', bio='From Boston', website='https://pixies.com')
+        doolittle = Album.objects.create(title='Doolittle', artist=kept)
+        bossanova = Album.objects.create(title='Bossanova', artist=merged)
+
+        moved, deleted = apply_merge_plan(Artist, [{'keep': kept.pk, 'merge': [merged.pk]}])
+
+        self.assertEqual((moved, deleted), (1, 1))
+        self.assertFalse(Artist.objects.filter(pk=merged.pk).exists())
+        self.assertEqual(set(kept.albums.all()), {doolittle, bossanova})
+        self.assertEqual(Album.objects.get(pk=bossanova.pk).artist_sort, 'pixies')
+        kept.refresh_from_db()
+        self.assertEqual((kept.bio, kept.website), ('From Boston', 'https://pixies.com'))
+        self.assertEqual(list(search_albums(Album.objects.all(), 'pixies bossa')), [bossanova])
+        self.assertEqual(list(search_artists(Artist.objects.all(), 'pixies')), [kept])
+
+    def test_plans_that_reuse_a_row_are_rejected(self):
+        a, b, c = (Genre.objects.create(name=name) for name in ['Rock', 'Rock & Roll', 'Rockabilly'])
+        with self.assertRaises(ValueError):
+            apply_merge_plan(Genre, [{'keep': a.pk, 'merge': [b.pk]}, {'keep': b.pk, 'merge': [c.pk]}])
+        self.assertEqual(Genre.objects.count(), 3)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('450 try again later')
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.message = OutboxMessage.objects.create(
+            subject='Album Request', body='Doolittle', from_email='shop@example.com', to=['kim@example.com']
+        )
+
+    @override_settings(EMAIL_BACKEND='music.tests.FailingEmailBackend')
+    def test_failures_back_off_until_max_attempts(self):
+        with self.assertLogs('music.outbox', 'WARNING'):
+            self.assertEqual(send_due(max_attempts=3), (0, 1))
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.attempts, 1)
+        self.assertIn('try again later', self.message.last_error)
+        delay = self.message.next_attempt_at - timezone.now()
+        self.assertAlmostEqual(delay.total_seconds(), RETRY_BASE, delta=5)
+        # Not due yet
+        self.assertEqual(send_due(max_attempts=3), (0, 0))
+
+        for attempts, status in [(2, OutboxMessage.STATUS_PENDING), (3, OutboxMessage.STATUS_FAILED)]:
+            OutboxMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+            with self.assertLogs('music.outbox', 'WARNING'):
+                send_due(max_attempts=3)
+            self.message.refresh_from_db()
+            self.assertEqual((self.message.attempts, self.message.status), (attempts, status))
+            if status == OutboxMessage.STATUS_PENDING:
+                delay = self.message.next_attempt_at - timezone.now()
+                self.assertAlmostEqual(delay.total_seconds(), RETRY_BASE * 2, delta=5)
+        # Failed messages are left for the admin
+        OutboxMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(send_due(max_attempts=3), (0, 0))
+
+    def test_sends_due_messages(self):
+        self.assertEqual(send_due(), (1, 0))
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, OutboxMessage.STATUS_SENT)
+        self.assertEqual([email.to for email in mail.outbox], [['kim@example.com']])
+
+
+class LinkImagesTests(CatalogTestCase):
+    def setUp(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(MEDIA_ROOT=str(directory)))
+        self.enterContext(contextlib.chdir(directory))
+        (directory / 'cds.json').write_text(json.dumps([
+            {'type': 'table', 'name': 'cds', 'data': [{'id': '1', 'artist': 'Pixies', 'album': 'Doolittle'}]},
+        ]))
+        (directory / 'album_covers').mkdir()
+        self.cover = directory / 'album_covers' / 'cover1.jpg'
+        self.album = make_album('Doolittle', 'Pixies')
+
+    def link_images(self):
+        call_command('link_images', stdout=StringIO())
+        return Album.objects.get(pk=self.album.pk).cover_image.name
+
+    def test_relinks_a_replaced_cover_of_the_same_size(self):
+        self.cover.write_bytes(b'first cover')
+        first = self.link_images()
+        self.assertTrue(first.startswith('images/'))
+        self.assertEqual(self.link_images(), first)
+
+        self.cover.write_bytes(b'other cover')
+        stored = os.stat(os.path.join(settings.MEDIA_ROOT, first))
+        os.utime(self.cover, ns=(stored.st_atime_ns, stored.st_mtime_ns + 1))
+        second = self.link_images()
+        self.assertNotEqual(second, first)
+        self.assertEqual(Album.objects.get(pk=self.album.pk).cover_image.read(), b'other cover')
@@ -0,0 +1,129 @@
+import logging
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# Per-request query and timing instrumentation.
+#
+# RequestTimingMiddleware wraps every query the request runs on the default
+# database (connection.execute_wrapper) to count them and add up their time,
+# and the TimedDjangoTemplates backend adds up template rendering, whether it
+# happens through a TemplateResponse, render() or render_to_string(). Each
+# response gets a Server-Timing header (shown in the browser's network panel)
+# and each request one logfmt line on the music.timing logger:
+#
+#   method=GET path=/collection/ view=collection status=200 queries=4 db=3.1ms render=12.4ms total=18.0ms
+#
+# Requests over REQUEST_QUERY_BUDGET queries or REQUEST_TIME_BUDGET ms are
+# logged as warnings with an over_budget= field, so LOG_LEVEL=WARNING keeps
+# only those. Queries run while a template renders (lazy querysets) count in
+# both db and render. The cost is two perf_counter() calls per query and per
+# render, cheap enough to leave on in production.
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.rendering = 0  # nesting depth: only the outermost render is timed
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings.rendering:
+            return super().render(context, request)
+        timings.rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.render += time.perf_counter() - started
+            timings.rendering -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time recorded for RequestTimingMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_budget = settings.REQUEST_QUERY_BUDGET
+        self.time_budget = settings.REQUEST_TIME_BUDGET
+        self.server_timing = settings.SERVER_TIMING
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = (time.perf_counter() - started) * 1000
+        db = timings.db * 1000
+        render = timings.render * 1000
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={db:.1f};desc="{timings.queries} queries", '
+                f'render;dur={render:.1f}, '
+                f'total;dur={total:.1f}'
+            )
+
+        over_budget = []
+        if self.query_budget and timings.queries > self.query_budget:
+            over_budget.append('queries')
+        if self.time_budget and total > self.time_budget:
+            over_budget.append('time')
+        if not over_budget and not logger.isEnabledFor(logging.INFO):
+            return response
+
+        match = request.resolver_match
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else '-',
+            'status': response.status_code,
+            'queries': timings.queries,
+            'db': round(db, 1),
+            'render': round(render, 1),
+            'total': round(total, 1),
+        }
+        message = (
+            f"method={fields['method']} path={fields['path']} view={fields['view']} status={fields['status']} "
+            f"queries={timings.queries} db={db:.1f}ms render={render:.1f}ms total={total:.1f}ms"
+        )
+        if over_budget:
+            fields['over_budget'] = over_budget
+            logger.warning('%s over_budget=%s', message, ','.join(over_budget), extra={'timing': fields})
+        else:
+            logger.info(message, extra={'timing': fields})
+        return response
@@ -3,17 +3,147 @@ from django.views.generic import TemplateView, ListView, DetailView, FormView
 from django.template.loader import render_to_string
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from django.core.mail import send_mail
 from django.conf import settings
-from django.db import models
-from .models import Album, Artist, Genre, Cart, CartItem
+from django.db import models, transaction
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+from .models import Album, Artist, Genre, Cart, CartItem, OutboxMessage
 from .forms import CheckoutForm
+from .context_processors import CART_COUNT_COOKIE, CART_COUNT_MAX_AGE, CART_COUNT_SALT
+from .search import fts_query, search_albums, search_artists
+from .pagination import keyset_page, InvalidCursor
+from .catalog import cached_fragment, catalog_changed_at, normalize_search, version_etag
+from .outbox import checkout_messages
 import uuid
 
+# -------------------------
+# Conditional GET
+# -------------------------
+
+def visitor_state(request):
+    """Cookies whose values show up in rendered pages (cart badge and buttons, CSRF token)"""
+    return [request.COOKIES.get(name) for name in ('cart_id', CART_COUNT_COOKIE, settings.CSRF_COOKIE_NAME)]
+
+
+def conditional_page(last_changed, per_visitor=True):
+    """
+    Answer If-None-Match / If-Modified-Since with a 304 before the view runs.
+    last_changed(request, **kwargs) returns when the catalog data behind the
+    response last changed, or None to skip validation (e.g. a missing object).
+    Pages with a cart badge or CSRF token also depend on the visitor's
+    cookies, so those go into the ETag and Last-Modified is only offered to
+    visitors without them.
+    """
+    def changed_at(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately; look the stamp up once
+        if not hasattr(request, '_catalog_changed_at'):
+            request._catalog_changed_at = last_changed(request, *args, **kwargs)
+        return request._catalog_changed_at
+
+    def etag(request, *args, **kwargs):
+        stamp = changed_at(request, *args, **kwargs)
+        if stamp is None:
+            return None
+        return version_etag(stamp, visitor_state(request) if per_visitor else None)
+
+    def last_modified(request, *args, **kwargs):
+        if per_visitor and any(visitor_state(request)):
+            return None
+        return changed_at(request, *args, **kwargs)
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        if per_visitor:
+            return vary_on_cookie(cache_control(private=True, no_cache=True)(view))
+        return cache_control(no_cache=True)(view)
+    return decorator
+
+
+def catalog_page_changed_at(request, *args, **kwargs):
+    return catalog_changed_at()
+
+
+def album_changed_at(request, pk, **kwargs):
+    # Track, artist, genre and label changes touch the album (see signals)
+    return Album.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+def artist_changed_at(request, pk, **kwargs):
+    stamps = Artist.objects.filter(pk=pk).annotate(
+        albums_updated_at=Max('albums__updated_at')
+    ).values_list('updated_at', 'albums_updated_at').first()
+    if stamps is None:
+        return None
+    return max(stamp for stamp in stamps if stamp is not None)
+
+
+
 # -------------------------
 # Core Views
 # -------------------------
 
+def get_album_queryset(params):
+    """Albums filtered and sorted by the collection page's query parameters"""
+    queryset = Album.objects.select_related('artist', 'genre', 'record_label')
+    genre = params.get('genre')
+    artist = params.get('artist')
+    label = params.get('label')
+    search = params.get('q')
+    # Searches default to best match first, browsing to recently added
+    sort = params.get('sort') or ('relevance' if search else '-id')
+
+    if genre:
+        queryset = queryset.filter(genre__name__icontains=genre)
+    if artist:
+        queryset = queryset.filter(artist__name__icontains=artist)
+    if label:
+        queryset = queryset.filter(record_label__name__icontains=label)
+    if search:
+        queryset = search_albums(queryset, search)
+
+    # Apply sorting (every ordering ends in id so keyset pagination is stable,
+    # and reads off one of Album's sort indexes)
+    if sort == 'artist':
+        queryset = queryset.order_by('artist_sort', 'title_sort', 'id')
+    elif sort == 'title':
+        queryset = queryset.order_by('title_sort', 'id')
+    elif sort == '-release_date':
+        queryset = queryset.order_by('-release_date', '-id')
+    elif sort == 'release_date':
+        queryset = queryset.order_by('release_date', 'id')
+    elif sort == 'genre':
+        queryset = queryset.order_by('genre_sort', 'artist_sort', 'id')
+    elif sort == 'relevance' and search and fts_query(search):
+        queryset = queryset.order_by('search_index__rank', '-id')
+    else:  # Default: -id (Recently Added)
+        queryset = queryset.order_by('-id')
+
+    return queryset
+
+
+def get_artist_queryset(params):
+    """Artists with at least one album, filtered by the artists page's search box"""
+    # Counted per artist shown rather than GROUP BY over every artist, so the
+    # name ordering can come straight off the unique index on name
+    albums = Album.objects.filter(artist=OuterRef('pk'))
+    album_count = albums.order_by().values('artist').annotate(count=models.Count('id')).values('count')
+    queryset = Artist.objects.annotate(
+        album_count=Subquery(album_count)
+    ).filter(Exists(albums)).order_by('name')
+
+    search = params.get('q')
+    if search:
+        queryset = search_artists(queryset, search)
+        if fts_query(search):
+            queryset = queryset.order_by('search_index__rank', 'name')
+
+    return queryset
+
+
+@method_decorator(conditional_page(catalog_page_changed_at), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'home.html'
     
@@ -24,51 +154,25 @@ class HomeView(TemplateView):
         return context
 
 
+@method_decorator(conditional_page(catalog_page_changed_at), name='dispatch')
 class CollectionView(ListView):
     model = Album
     template_name = 'collection.html'
     context_object_name = 'albums'
-    paginate_by = 20
+    page_size = 20
 
     def get_queryset(self):
-        queryset = Album.objects.select_related('artist', 'genre', 'record_label')
-        genre = self.request.GET.get('genre')
-        artist = self.request.GET.get('artist')
-        label = self.request.GET.get('label')
-        search = self.request.GET.get('q')
-        sort = self.request.GET.get('sort', '-id')
-
-        if genre:
-            queryset = queryset.filter(genre__name__icontains=genre)
-        if artist:
-            queryset = queryset.filter(artist__name__icontains=artist)
-        if label:
-            queryset = queryset.filter(record_label__name__icontains=label)
-        if search:
-            queryset = queryset.filter(title__icontains=search)
-
-        # Apply sorting
-        if sort == 'artist':
-            queryset = queryset.order_by('artist__name', 'title')
-        elif sort == 'title':
-            queryset = queryset.order_by('title')
-        elif sort == '-release_date':
-            queryset = queryset.order_by('-release_date', '-id')
-        elif sort == 'release_date':
-            queryset = queryset.order_by('release_date', 'id')
-        elif sort == 'genre':
-            queryset = queryset.order_by('genre__name', 'artist__name')
-        else:  # Default: -id (Recently Added)
-            queryset = queryset.order_by('-id')
-
-        return queryset
-    
+        return get_album_queryset(self.request.GET)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        # First page only; infinite scroll continues from next_cursor
+        context['albums'], context['next_cursor'] = keyset_page(self.object_list, per_page=self.page_size)
         context['genres'] = Genre.objects.all().order_by('name')
         return context
 
 
+@method_decorator(conditional_page(album_changed_at), name='dispatch')
 class AlbumDetailView(DetailView):
     model = Album
     template_name = 'album_detail.html'
@@ -81,34 +185,30 @@ class AlbumDetailView(DetailView):
         in_cart = False
         
         if cookie_id:
-            try:
-                cart = Cart.objects.get(cookie_id=cookie_id)
-                in_cart = CartItem.objects.filter(cart=cart, album=self.object).exists()
-            except Cart.DoesNotExist:
-                pass
+            in_cart = CartItem.objects.filter(cart__cookie_id=cookie_id, album=self.object).exists()
         
         context['in_cart'] = in_cart
         return context
 
 
+@method_decorator(conditional_page(catalog_page_changed_at), name='dispatch')
 class ArtistsListView(ListView):
     model = Artist
     template_name = 'artist_list.html'
     context_object_name = 'artists'
-    paginate_by = 24
+    page_size = 24
 
     def get_queryset(self):
-        queryset = Artist.objects.annotate(
-            album_count=models.Count('albums')
-        ).filter(album_count__gt=0).order_by('name')
-        
-        search = self.request.GET.get('q')
-        if search:
-            queryset = queryset.filter(name__icontains=search)
-        
-        return queryset
+        return get_artist_queryset(self.request.GET)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # First page only; infinite scroll continues from next_cursor
+        context['artists'], context['next_cursor'] = keyset_page(self.object_list, per_page=self.page_size)
+        return context
 
 
+@method_decorator(conditional_page(artist_changed_at), name='dispatch')
 class ArtistDetailView(DetailView):
     model = Artist
     template_name = 'artist_detail.html'
@@ -119,7 +219,10 @@ def cart_view(request):
     cookie_id = request.COOKIES.get('cart_id')
     cart = Cart.objects.filter(cookie_id=cookie_id).first()
     items = cart.items.select_related('album') if cart else []
-    return render(request, 'cart.html', {'cart': cart, 'items': items})
+    response = render(request, 'cart.html', {'cart': cart, 'items': items})
+    if cart:
+        set_cart_count(response, cart, cookie_id)
+    return response
 
 
 class CheckoutView(FormView):
@@ -138,85 +241,19 @@ class CheckoutView(FormView):
         cart = get_object_or_404(Cart, cookie_id=cookie_id)
         checkout = form.save(commit=False)
         checkout.cart = cart
-        checkout.save()
-        
-        # Send email notifications
-        self.send_checkout_emails(checkout, cart)
-        
+
+        # Queue the email notifications with the checkout; send_outbox delivers them
+        with transaction.atomic():
+            checkout.save()
+            OutboxMessage.objects.bulk_create(checkout_messages(checkout, cart))
+
         # Clear the cookie so user gets a fresh cart next time
         # Keep the cart/checkout in database for history
         response = redirect('checkout_success')
         response.delete_cookie('cart_id')
+        response.delete_cookie(CART_COUNT_COOKIE)
         
         return response
-    
-    def send_checkout_emails(self, checkout, cart):
-        """Send checkout notification to The Collector and copy to requestor"""
-        
-        # Build the email body
-        items = cart.items.select_related('album__artist').all()
-        
-        email_body = f"""PyGroove Album Request
-======================
-
-From: {checkout.name}
-Email: {checkout.email}
-
-CHECKOUT REQUEST
-================
-
-Requested Albums:
-
-"""
-        for i, item in enumerate(items, 1):
-            email_body += f"""Album #{i}:
-  ID: {item.album.id}
-  Artist: {item.album.artist.name}
-  Album: {item.album.title}
-  Year: {item.album.release_date.year if item.album.release_date else 'N/A'}
-  Quantity: {item.quantity}
-
-"""
-        
-        email_body += f"""
-Shipping Address:
------------------
-{checkout.mailing_address}
-"""
-        
-        if checkout.message:
-            email_body += f"""
-Additional Message:
--------------------
-{checkout.message}
-"""
-        
-        subject = "PyGroove :: Album Request"
-        
-        # Send to The Collector
-        try:
-            send_mail(
-                subject=subject,
-                message=email_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[settings.COLLECTOR_EMAIL],
-                fail_silently=False,
-            )
-            
-            # Send copy to requestor
-            requestor_subject = f"Copy: {subject}"
-            requestor_body = f"This is a copy of your album request to PyGroove:\n\n{email_body}"
-            
-            send_mail(
-                subject=requestor_subject,
-                message=requestor_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[checkout.email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            # Log the error but don't break the checkout flow
-            print(f"Error sending email: {e}")
 
 
 # -------------------------
@@ -236,6 +273,15 @@ def get_cart(request):
     return cart, cookie_id
 
 
+def set_cart_count(response, cart, cookie_id):
+    """Store the cart's item count in the signed cookie read by the cart_count context processor"""
+    count = cart.items.count()
+    response.set_signed_cookie(
+        CART_COUNT_COOKIE, f'{cookie_id}:{count}', salt=CART_COUNT_SALT, max_age=CART_COUNT_MAX_AGE
+    )
+    return response
+
+
 def add_to_cart(request, album_id):
     cart, cookie_id = get_cart(request)
     album = get_object_or_404(Album, pk=album_id)
@@ -244,17 +290,19 @@ def add_to_cart(request, album_id):
     if not created:
         item.quantity += 1
         item.save()
+    # The cookie below is reissued, so the cart's expiry clock restarts too
+    cart.save(update_fields=['updated_at'])
 
     response = redirect('cart')
     response.set_cookie('cart_id', cookie_id, max_age=30*24*60*60)  # 30 days
-    return response
+    return set_cart_count(response, cart, cookie_id)
 
 
 def remove_from_cart(request, item_id):
     cart, cookie_id = get_cart(request)
     item = get_object_or_404(CartItem, pk=item_id, cart=cart)
     item.delete()
-    return redirect('cart')
+    return set_cart_count(redirect('cart'), cart, cookie_id)
 
 
 def update_cart_item(request, item_id):
@@ -265,91 +313,105 @@ def update_cart_item(request, item_id):
         qty = int(request.POST.get('quantity', 1))
         item.quantity = max(1, qty)
         item.save()
-    return redirect('cart')
+    return set_cart_count(redirect('cart'), cart, cookie_id)
 
 
 # -------------------------
 # AJAX Endpoints
 # -------------------------
 
+@conditional_page(catalog_page_changed_at, per_visitor=False)
 def collection_ajax(request):
-    genre = request.GET.get('genre')
-    artist = request.GET.get('artist')
-    label = request.GET.get('label')
-    search = request.GET.get('q')
-    sort = request.GET.get('sort', '-id')
-    page = request.GET.get('page', 1)
-
-    queryset = Album.objects.select_related('artist', 'genre', 'record_label')
-
-    if genre:
-        queryset = queryset.filter(genre__name__icontains=genre)
-    if artist:
-        queryset = queryset.filter(artist__name__icontains=artist)
-    if label:
-        queryset = queryset.filter(record_label__name__icontains=label)
-    if search:
-        queryset = queryset.filter(title__icontains=search)
-
-    # Apply sorting
-    if sort == 'artist':
-        queryset = queryset.order_by('artist__name', 'title')
-    elif sort == 'title':
-        queryset = queryset.order_by('title')
-    elif sort == '-release_date':
-        queryset = queryset.order_by('-release_date', '-id')
-    elif sort == 'release_date':
-        queryset = queryset.order_by('release_date', 'id')
-    elif sort == 'genre':
-        queryset = queryset.order_by('genre__name', 'artist__name')
-    else:  # Default: -id (Recently Added)
-        queryset = queryset.order_by('-id')
+    params = request.GET
+    # The cache key and the query both use these, so equal keys always mean equal results
+    parts = {
+        'genre': normalize_search(params.get('genre')),
+        'artist': normalize_search(params.get('artist')),
+        'label': normalize_search(params.get('label')),
+        'q': normalize_search(params.get('q')),
+        'sort': params.get('sort', ''),
+        'page': params.get('page', '1'),
+        'cursor': params.get('cursor'),
+    }
+
+    def render_page():
+        queryset = get_album_queryset(parts)
+
+        # Cursor mode: bounded index seek from the last album seen, no COUNT(*)
+        if parts['cursor'] is not None:
+            albums, next_cursor = keyset_page(queryset, parts['cursor'], 20)
+            html = render_to_string('partials/album_cards.html', {'albums': albums}, request=request) if albums else ''
+            return {'html': html, 'next': next_cursor}
+
+        page = parts['page']
+        paginator = Paginator(queryset, 20)
+        albums = paginator.get_page(page)
+
+        # Return empty HTML if we're beyond the last page or no results
+        if int(page) > paginator.num_pages or not albums:
+            return {'html': ''}
+
+        html = render_to_string('partials/album_cards.html', {'albums': albums}, request=request)
+        return {'html': html}
+
+    try:
+        return JsonResponse(cached_fragment('collection', parts, render_page))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+
+@conditional_page(catalog_page_changed_at, per_visitor=False)
+def artists_ajax(request):
+    params = request.GET
+    parts = {
+        'q': normalize_search(params.get('q')),
+        'page': params.get('page', '1'),
+        'cursor': params.get('cursor'),
+    }
 
-    paginator = Paginator(queryset, 20)
-    albums = paginator.get_page(page)
+    def render_page():
+        queryset = get_artist_queryset(parts)
 
-    # Return empty HTML if we're beyond the last page or no results
-    if int(page) > paginator.num_pages or not albums:
-        return JsonResponse({'html': ''})
+        # Cursor mode: bounded index seek from the last artist seen, no COUNT(*)
+        if parts['cursor'] is not None:
+            artists, next_cursor = keyset_page(queryset, parts['cursor'], 24)
+            html = render_to_string('partials/artist_cards.html', {'artists': artists}, request=request) if artists else ''
+            return {'html': html, 'next': next_cursor}
 
-    html = render_to_string('partials/album_cards.html', {'albums': albums}, request=request)
-    return JsonResponse({'html': html})
+        page = parts['page']
+        paginator = Paginator(queryset, 24)
+        artists = paginator.get_page(page)
 
+        # Return empty HTML if we're beyond the last page or no results
+        if int(page) > paginator.num_pages or not artists:
+            return {'html': ''}
 
-def artists_ajax(request):
-    search = request.GET.get('q')
-    page = request.GET.get('page', 1)
+        html = render_to_string('partials/artist_cards.html', {'artists': artists}, request=request)
+        return {'html': html}
 
-    queryset = Artist.objects.annotate(
-        album_count=models.Count('albums')
-    ).filter(album_count__gt=0).order_by('name')
-    
-    if search:
-        queryset = queryset.filter(name__icontains=search)
-
-    paginator = Paginator(queryset, 24)
-    artists = paginator.get_page(page)
-
-    # Return empty HTML if we're beyond the last page or no results
-    if int(page) > paginator.num_pages or not artists:
-        return JsonResponse({'html': ''})
-
-    html = render_to_string('partials/artist_cards.html', {'artists': artists}, request=request)
-    return JsonResponse({'html': html})
+    try:
+        return JsonResponse(cached_fragment('artists', parts, render_page))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
 
+@conditional_page(artist_changed_at, per_visitor=False)
 def artist_albums_ajax(request, pk):
-    artist = get_object_or_404(Artist, pk=pk)
     filter_type = request.GET.get('filter', 'all')
 
-    albums = artist.albums.all()
-    if filter_type == 'genre':
-        albums = albums.order_by('genre__name')
-    elif filter_type == 'label':
-        albums = albums.order_by('record_label__name')
+    def render_albums():
+        artist = get_object_or_404(Artist, pk=pk)
+
+        albums = artist.albums.all()
+        if filter_type == 'genre':
+            albums = albums.order_by('genre__name')
+        elif filter_type == 'label':
+            albums = albums.order_by('record_label__name')
+
+        html = render_to_string('partials/album_cards.html', {'albums': albums}, request=request)
+        return {'html': html}
 
-    html = render_to_string('partials/album_cards.html', {'albums': albums}, request=request)
-    return JsonResponse({'html': html})
+    return JsonResponse(cached_fragment('artist_albums', {'pk': pk, 'filter': filter_type}, render_albums))
 
 
 # -------------------------
@@ -48,19 +48,21 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise right after SecurityMiddleware
+    'music.timing.RequestTimingMiddleware',  # After WhiteNoise, so static files aren't timed
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'music.context_processors.CartCountCookieMiddleware',
 ]
 
 ROOT_URLCONF = 'pygroove.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'music.timing.TimedDjangoTemplates',  # DjangoTemplates plus render timing
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,6 +79,25 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'pygroove.wsgi.application'
 
+# Per-request instrumentation (music/timing.py): requests over either budget are
+# logged as warnings; 0 disables a budget. SERVER_TIMING adds the response header,
+# which shows every visitor the query count and DB time, so only in DEBUG by default.
+REQUEST_QUERY_BUDGET = secrets.get('REQUEST_QUERY_BUDGET', 20)
+REQUEST_TIME_BUDGET = secrets.get('REQUEST_TIME_BUDGET', 300)  # ms
+SERVER_TIMING = secrets.get('SERVER_TIMING', DEBUG)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # music.timing logs every request at INFO; LOG_LEVEL=WARNING keeps only the over-budget ones
+        'music': {'handlers': ['console'], 'level': secrets.get('LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -85,9 +106,45 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections between requests, so the per-connection setup in
+        # music/db.py isn't repeated for every page
+        'CONN_MAX_AGE': secrets.get('CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Applied to every new connection (mmap, busy timeout...; see music/db.py),
+# e.g. {"mmap_size": 0, "busy_timeout": 10000} in secrets.json
+SQLITE_PRAGMAS = secrets.get('SQLITE_PRAGMAS', {})
+
+
+# Cache
+# Shared by all gunicorn workers through one WAL-mode SQLite file (see music/cache.py)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'music.cache.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': secrets.get('CACHE_MAX_ENTRIES', 5000),
+            'LOCK_TIMEOUT': 30,
+        },
+    },
+    # Recorded Discogs API responses and image downloads (see music/discogs.py).
+    # Entries never expire here; DISCOGS_CACHE_TTL decides when they are refetched.
+    'discogs': {
+        'BACKEND': 'music.cache.SQLiteCache',
+        'LOCATION': BASE_DIR / 'discogs_cache.sqlite3',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': secrets.get('DISCOGS_CACHE_MAX_ENTRIES', 20000),
+            # Recorded images (--cache-images) are far bigger than API responses
+            'MAX_BYTES': secrets.get('DISCOGS_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,6 +189,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'  # For collectstatic in production
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Media URLs are versioned so music.media.serve_media can mark them immutable
+STORAGES = {
+    'default': {'BACKEND': 'music.media.VersionedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Let the front-end server send media bytes: None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+MEDIA_ACCEL = secrets.get('MEDIA_ACCEL')
+MEDIA_ACCEL_PREFIX = secrets.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
 # WhiteNoise configuration for serving static and media files
 WHITENOISE_USE_FINDERS = True
 WHITENOISE_AUTOREFRESH = True  # Only in development
@@ -157,9 +224,13 @@ else:
     EMAIL_USE_TLS = True
     EMAIL_HOST_USER = secrets.get('EMAIL_HOST_USER', '')
     EMAIL_HOST_PASSWORD = secrets.get('EMAIL_HOST_PASSWORD', '')
+    EMAIL_TIMEOUT = 30  # send_outbox retries later rather than hanging on a stuck server
 
 DEFAULT_FROM_EMAIL = secrets.get('EMAIL_HOST_USER', 'pygroove@lar-mo.com')
 COLLECTOR_EMAIL = secrets.get('COLLECTOR_EMAIL', 'phpcds@aretemm.net')
+# Checkout emails go through the outbox (music.outbox); give up on a message after this many tries
+OUTBOX_MAX_ATTEMPTS = secrets.get('OUTBOX_MAX_ATTEMPTS', 8)
 
 # Discogs API
 DISCOGS_TOKEN = secrets.get('DISCOGS_TOKEN', '')
+DISCOGS_CACHE_TTL = secrets.get('DISCOGS_CACHE_TTL', 60 * 60 * 24 * 30)  # 30 days
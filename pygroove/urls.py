@@ -1,12 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.views.static import serve
+from music.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('music.urls')),
     
     # Serve media files in production
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^media/(?P<path>.*)$', serve_media),
 ]